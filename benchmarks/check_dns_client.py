@@ -0,0 +1,186 @@
+import sys
+import time
+import logging
+import pathlib
+import argparse
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_nameserver import FakeNameserver
+from dns_api.dns_client import DNSClient
+
+
+ZONE: str = "example.com"
+# short, a silent server should not slow the checks down
+TIMEOUT: float = 0.3
+
+
+def new_nameserver() -> FakeNameserver:
+    nameserver = FakeNameserver()
+    nameserver.set_records(ZONE, "NS", "ns1." + ZONE, "ns2.example.net")
+    nameserver.set_records("host." + ZONE, "A", "1.2.3.4")
+    nameserver.set_records("host." + ZONE, "AAAA", "2001:db8::1")
+    nameserver.set_records("www." + ZONE, "CNAME", "host." + ZONE)
+    nameserver.set_records("txt." + ZONE, "TXT", "v=" + "x" * 300)
+    nameserver.start()
+    return nameserver
+
+
+def new_client() -> DNSClient:
+    return DNSClient(timeout=TIMEOUT, retries=0)
+
+
+def new_api(nameserver: FakeNameserver, configured: bool = True):
+    from dns_api import CloudflareDNSApi, CloudflareDNSConfig
+    api = CloudflareDNSApi(CloudflareDNSConfig(handler_class=CloudflareDNSApi, domain=ZONE, token="check",
+                                               zone_id="check", api_base="http://127.0.0.1:9", verify_dns=True,
+                                               nameservers=[nameserver.address] if configured else []),
+                           logging.getLogger("check"))
+    api.dns_client = new_client()
+    if not configured:
+        # as if the zone's NS records had pointed at the stand-in
+        api.dns_client.discovered[ZONE] = (time.monotonic() + 60, [("127.0.0.1", nameserver.port)])
+    return api
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise AssertionError(message)
+
+
+def check_answers():
+    # every question over one UDP socket, answers matched by id
+    nameserver = new_nameserver()
+    questions = [("host." + ZONE, "A"), ("host." + ZONE, "AAAA"), ("www." + ZONE, "CNAME"),
+                 ("txt." + ZONE, "TXT"), (ZONE, "NS")]
+    responses = new_client().query_many(("127.0.0.1", nameserver.port), questions)
+    values = [response.values(*question) for question, response in zip(questions, responses)]
+    check(values == [["1.2.3.4"], ["2001:db8::1"], ["host." + ZONE], ["v=" + "x" * 300],
+                     ["ns1." + ZONE, "ns2.example.net"]], f"unexpected answers {values}")
+    check(all(response.authoritative and response.rcode == DNSClient.RCODE_NOERROR for response in responses),
+          "answers are not authoritative NOERROR")
+    check(nameserver.counters()["tcp_queries"] == 0, "plain answers went over TCP")
+    nameserver.stop()
+
+
+def check_nxdomain_and_nodata():
+    nameserver = new_nameserver()
+    nxdomain, nodata = new_client().query_many(("127.0.0.1", nameserver.port),
+                                               [("missing." + ZONE, "A"), ("www." + ZONE, "A")])
+    check(nxdomain.rcode == DNSClient.RCODE_NXDOMAIN and not nxdomain.answers, "missing name is not NXDOMAIN")
+    check(nodata.rcode == DNSClient.RCODE_NOERROR and not nodata.values("www." + ZONE, "A"),
+          "name without the type is not an empty NOERROR")
+    nameserver.stop()
+
+
+def check_truncated_over_tcp():
+    # TC bit set, the question is asked again over TCP, still with EDNS
+    nameserver = new_nameserver()
+    nameserver.truncate_udp = True
+    response = new_client().query_many(("127.0.0.1", nameserver.port), [("txt." + ZONE, "TXT")])[0]
+    check(response is not None and response.values("txt." + ZONE, "TXT") == ["v=" + "x" * 300],
+          f"no answer over TCP after truncation: {response}")
+    counters = nameserver.counters()
+    check(counters["udp_queries"] == 1 and counters["tcp_queries"] == 1, f"unexpected queries {counters}")
+    check(counters["edns_queries"] == 2, "TCP retry of a truncated answer dropped EDNS")
+    nameserver.stop()
+
+
+def check_formerr_without_edns():
+    # an old server answering FORMERR to EDNS, asked again without the OPT record
+    nameserver = new_nameserver()
+    nameserver.edns = False
+    response = new_client().query_many(("127.0.0.1", nameserver.port), [("host." + ZONE, "A")])[0]
+    check(response is not None and response.values("host." + ZONE, "A") == ["1.2.3.4"],
+          f"no answer after FORMERR: {response}")
+    counters = nameserver.counters()
+    check(counters["tcp_queries"] == 1 and counters["edns_queries"] == 1, f"unexpected queries {counters}")
+    nameserver.stop()
+
+
+def check_no_answer():
+    nameserver = new_nameserver()
+    nameserver.silent = True
+    start = time.monotonic()
+    responses = new_client().query_many(("127.0.0.1", nameserver.port), [("host." + ZONE, "A"), (ZONE, "NS")])
+    check(responses == [None, None], f"answers from a silent server {responses}")
+    check(time.monotonic() - start < TIMEOUT * 3, "waited past the timeout")
+    nameserver.stop()
+
+
+def check_compression_loop():
+    # a name pointing at itself
+    data = bytes(12) + b"\xc0\x0c"
+    try:
+        DNSClient.read_name(data, 12)
+    except ValueError:
+        return
+    raise AssertionError("compression loop not detected")
+
+
+def check_verify_match():
+    nameserver = new_nameserver()
+    results = new_api(nameserver).verify_records([("host", "A", "1.2.3.4"), ("host", "AAAA", "2001:DB8:0::1"),
+                                                  ("www", "CNAME", "HOST.example.com."),
+                                                  ("missing", "A", ""), ("www", "A", "")])
+    check(results == [True] * 5, f"matching records not verified {results}")
+    nameserver.stop()
+
+
+def check_verify_mismatch():
+    nameserver = new_nameserver()
+    results = new_api(nameserver).verify_records([("host", "A", "5.6.7.8"), ("missing", "A", "1.2.3.4"),
+                                                  ("host", "A", "")])
+    check(results == [False] * 3, f"mismatching records verified {results}")
+    nameserver.stop()
+
+
+def check_verify_no_answer():
+    nameserver = new_nameserver()
+    nameserver.silent = True
+    results = new_api(nameserver).verify_records([("host", "A", "1.2.3.4")])
+    check(results == [None], f"unanswered record not left open {results}")
+    nameserver.stop()
+
+
+def check_verify_authoritative_only():
+    # a discovered server has to answer authoritatively, a configured one is trusted as it is
+    nameserver = new_nameserver()
+    nameserver.authoritative = False
+    results = new_api(nameserver, configured=False).verify_records([("host", "A", "1.2.3.4")])
+    check(results == [None], f"non-authoritative answer of a discovered server used {results}")
+    results = new_api(nameserver).verify_records([("host", "A", "1.2.3.4")])
+    check(results == [True], f"answer of a configured server not used {results}")
+    nameserver.authoritative = True
+    results = new_api(nameserver, configured=False).verify_records([("host", "A", "1.2.3.4")])
+    check(results == [True], f"authoritative answer of a discovered server not used {results}")
+    nameserver.stop()
+
+
+CHECKS = (check_answers, check_nxdomain_and_nodata, check_truncated_over_tcp, check_formerr_without_edns,
+          check_no_answer, check_compression_loop, check_verify_match, check_verify_mismatch,
+          check_verify_no_answer, check_verify_authoritative_only)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks of the DNS client against a local stub nameserver")
+    parser.add_argument("--log", action="store_true", help="show the API logs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.log else logging.CRITICAL)
+
+    failed = 0
+    for check_function in CHECKS:
+        try:
+            check_function()
+        except Exception as e:
+            failed += 1
+            print(f"FAILED  {check_function.__name__}: {type(e).__name__}: {e}")
+        else:
+            print(f"ok      {check_function.__name__}")
+    print(f"\n{len(CHECKS) - failed} of {len(CHECKS)} checks passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
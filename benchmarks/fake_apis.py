@@ -0,0 +1,161 @@
+import re
+import json
+import itertools
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeApiServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, handler_class: type) -> None:
+        super().__init__(("127.0.0.1", 0), handler_class)
+        self.lock = threading.Lock()
+        self.requests: int = 0
+        self.connections: int = 0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def counters(self) -> dict[str, int]:
+        with self.lock:
+            return {"requests": self.requests, "connections": self.connections}
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, like the real endpoints
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status_code: int, body=None):
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def handle_request(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        with self.server.lock:
+            self.server.requests += 1
+            self.route(self.command, url.path, {key: values[0] for key, values in parse_qs(url.query).items()}, body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = handle_request
+
+    def route(self, method: str, path: str, query: dict, body):
+        self.send_json(404)
+
+
+class FakeCloudflareHandler(FakeApiHandler):
+
+    # zone id -> record id -> record, zones are named "<zone id>.example" by the benchmark
+    zones: dict[str, dict[str, dict]] = {}
+    ids = itertools.count(1)
+
+    def full_name(self, zone_id: str, name: str) -> str:
+        domain = zone_id + ".example"
+        if name in ("@", domain):
+            return domain
+        return name if name.endswith("." + domain) else name + "." + domain
+
+    def create(self, zone_id: str, payload: dict) -> dict:
+        record = {"id": str(next(self.ids)), "name": self.full_name(zone_id, payload["name"]),
+                  "type": payload["type"], "content": payload["content"], "ttl": payload.get("ttl", 1),
+                  "proxied": payload.get("proxied", False), "comment": None}
+        self.zones[zone_id][record["id"]] = record
+        return record
+
+    def update(self, zone_id: str, record_id: str, payload: dict) -> dict:
+        record = self.zones[zone_id][record_id]
+        record.update({key: value for key, value in payload.items() if key != "id"})
+        record["name"] = self.full_name(zone_id, record["name"])
+        return record
+
+    def route(self, method: str, path: str, query: dict, body):
+        match = re.match(r"/client/v4/zones/([^/]+)/dns_records(?:/([^/]+))?$", path)
+        if not match:
+            return self.send_json(404, {"success": False, "errors": [{"code": 7003}]})
+        zone_id, record_id = match.groups()
+        zone = self.zones.setdefault(zone_id, {})
+        if record_id == "batch" and method == "POST":
+            # all or nothing, like the real batch endpoint
+            if any(item["id"] not in zone for item in body.get("deletes", []) + body.get("patches", [])):
+                return self.send_json(404, {"success": False, "errors": [{"code": 81044}]})
+            result = {"deletes": [zone.pop(item["id"]) for item in body.get("deletes", [])],
+                      "patches": [dict(self.update(zone_id, item["id"], item)) for item in body.get("patches", [])],
+                      "posts": [self.create(zone_id, item) for item in body.get("posts", [])],
+                      "puts": []}
+            return self.send_json(200, {"success": True, "result": result})
+        if record_id is None:
+            if method == "POST":
+                return self.send_json(200, {"success": True, "result": self.create(zone_id, body)})
+            records = [record for record in zone.values()
+                       if ("name" not in query or record["name"] == query["name"])
+                       and ("type" not in query or record["type"] == query["type"])]
+            page, per_page = int(query.get("page", 1)), int(query.get("per_page", 100))
+            total_pages = max(1, -(-len(records) // per_page))
+            return self.send_json(200, {"success": True,
+                                        "result": records[(page - 1) * per_page:page * per_page],
+                                        "result_info": {"page": page, "per_page": per_page,
+                                                        "total_pages": total_pages, "total_count": len(records)}})
+        if record_id not in zone:
+            return self.send_json(404, {"success": False, "errors": [{"code": 81044}]})
+        if method == "PATCH":
+            return self.send_json(200, {"success": True, "result": self.update(zone_id, record_id, body)})
+        if method == "DELETE":
+            zone.pop(record_id)
+            return self.send_json(200, {"success": True, "result": {"id": record_id}})
+        return self.send_json(200, {"success": True, "result": zone[record_id]})
+
+
+class FakeGodaddyHandler(FakeApiHandler):
+
+    # domain -> list of {"name", "type", "data", "ttl"}
+    domains: dict[str, list[dict]] = {}
+
+    def route(self, method: str, path: str, query: dict, body):
+        match = re.match(r"/v1/domains/([^/]+)/records(?:/([^/]+))?(?:/([^/]+))?$", path)
+        if not match:
+            return self.send_json(404, {"code": "NOT_FOUND"})
+        domain, type, name = match.groups()
+        records = self.domains.setdefault(domain, [])
+        if type is None:
+            offset, limit = int(query.get("offset", 0)), int(query.get("limit", 500))
+            return self.send_json(200, records[offset:offset + limit])
+        if name is None and method == "PUT":
+            # replaces every record of the type
+            records[:] = ([record for record in records if record["type"] != type]
+                          + [dict(item, type=type) for item in body])
+            return self.send_json(200)
+        matching = [record for record in records if record["type"] == type and record["name"] == name]
+        if method == "GET":
+            return self.send_json(200, matching)
+        if method not in ("PUT", "DELETE"):
+            return self.send_json(405)
+        records[:] = [record for record in records if record not in matching]
+        if method == "PUT":
+            records.extend(dict(item, type=type, name=name) for item in body)
+            return self.send_json(200)
+        return self.send_json(204 if matching else 404)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import socket
+import struct
+import threading
+import ipaddress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+SERVICE_TYPE: str = "urn:schemas-upnp-org:service:WANIPConnection:1"
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+
+    server: FakeGatewayHttpServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, body: str):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=\"utf-8\"")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # device description, the control URL is relative to it
+        self.server.gateway.count("upnp_requests")
+        self.reply(f"<?xml version=\"1.0\"?>"
+                   f"<root xmlns=\"urn:schemas-upnp-org:device-1-0\"><device>"
+                   f"<deviceType>urn:schemas-upnp-org:device:InternetGatewayDevice:1</deviceType>"
+                   f"<deviceList><device><deviceList><device><serviceList><service>"
+                   f"<serviceType>{SERVICE_TYPE}</serviceType><controlURL>/ctl/IPConn</controlURL>"
+                   f"</service></serviceList></device></deviceList></device></deviceList>"
+                   f"</device></root>")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.gateway.count("upnp_requests")
+        self.reply(f"<?xml version=\"1.0\"?>"
+                   f"<s:Envelope xmlns:s=\"http://schemas.xmlsoap.org/soap/envelope/\"><s:Body>"
+                   f"<u:GetExternalIPAddressResponse xmlns:u=\"{SERVICE_TYPE}\">"
+                   f"<NewExternalIPAddress>{self.server.gateway.wan_ip}</NewExternalIPAddress>"
+                   f"</u:GetExternalIPAddressResponse></s:Body></s:Envelope>")
+
+
+class FakeGatewayHttpServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, gateway) -> None:
+        self.gateway: FakeGateway = gateway
+        super().__init__(("127.0.0.1", 0), FakeGatewayHandler)
+
+
+class FakeGateway:
+
+    # answers SSDP searches, the UPnP description / SOAP calls and NAT-PMP address requests on 127.0.0.1
+    def __init__(self, wan_ip: str = "1.2.3.4") -> None:
+        self.wan_ip: str = wan_ip
+        self.lock = threading.Lock()
+        self.request_counts: dict[str, int] = {"upnp_requests": 0, "natpmp_requests": 0}
+        self.http_server = FakeGatewayHttpServer(self)
+        self.ssdp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.ssdp_socket.bind(("127.0.0.1", 0))
+        self.natpmp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.natpmp_socket.bind(("127.0.0.1", 0))
+        self.threads = [threading.Thread(target=self.http_server.serve_forever, daemon=True),
+                        threading.Thread(target=self.serve_ssdp, daemon=True),
+                        threading.Thread(target=self.serve_natpmp, daemon=True)]
+
+    @property
+    def ssdp_port(self) -> int:
+        return self.ssdp_socket.getsockname()[1]
+
+    @property
+    def natpmp_port(self) -> int:
+        return self.natpmp_socket.getsockname()[1]
+
+    def set_wan_ip(self, wan_ip: str):
+        self.wan_ip = wan_ip
+
+    def count(self, counter: str):
+        with self.lock:
+            self.request_counts[counter] += 1
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def serve_ssdp(self):
+        location = f"http://127.0.0.1:{self.http_server.server_port}/rootDesc.xml"
+        while True:
+            try:
+                data, address = self.ssdp_socket.recvfrom(65535)
+            except OSError:
+                return
+            if data.startswith(b"M-SEARCH"):
+                self.count("upnp_requests")
+                self.ssdp_socket.sendto((f"HTTP/1.1 200 OK\r\nCACHE-CONTROL: max-age=120\r\n"
+                                         f"ST: urn:schemas-upnp-org:device:InternetGatewayDevice:1\r\n"
+                                         f"LOCATION: {location}\r\n\r\n").encode(), address)
+
+    def serve_natpmp(self):
+        while True:
+            try:
+                data, address = self.natpmp_socket.recvfrom(64)
+            except OSError:
+                return
+            if data[:2] == b"\x00\x00":
+                self.count("natpmp_requests")
+                # version 0, opcode 128, result 0, seconds since start of epoch, external address
+                self.natpmp_socket.sendto(struct.pack("!BBHI", 0, 128, 0, 1)
+                                          + ipaddress.IPv4Address(self.wan_ip).packed, address)
+
+    def counters(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.request_counts)
+
+    def stop(self):
+        self.http_server.shutdown()
+        self.ssdp_socket.close()
+        self.natpmp_socket.close()
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import socket
+import struct
+import threading
+import ipaddress
+
+
+TYPES: dict[int, str] = {1: "A", 2: "NS", 5: "CNAME", 16: "TXT", 28: "AAAA"}
+TYPE_CODES: dict[str, int] = {name: code for code, name in TYPES.items()}
+
+
+class FakeNameserver:
+
+    # answers DNS queries over UDP and TCP on one port of 127.0.0.1, from records set by the caller,
+    # and can misbehave like real servers do: truncate every UDP answer, refuse EDNS, not answer at all
+    def __init__(self) -> None:
+        # (name, type) to values, a name without any record is NXDOMAIN
+        self.records: dict[tuple[str, str], list[str]] = {}
+        self.authoritative: bool = True
+        self.truncate_udp: bool = False
+        self.edns: bool = True
+        self.silent: bool = False
+        self.lock = threading.Lock()
+        self.request_counts: dict[str, int] = {"udp_queries": 0, "tcp_queries": 0, "edns_queries": 0}
+        # the same port for both, like a real nameserver
+        while True:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind(("127.0.0.1", 0))
+            self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                self.tcp_socket.bind(("127.0.0.1", self.port))
+                break
+            except OSError:
+                self.udp_socket.close()
+                self.tcp_socket.close()
+        self.tcp_socket.listen(16)
+        self.threads = [threading.Thread(target=self.serve_udp, daemon=True),
+                        threading.Thread(target=self.serve_tcp, daemon=True)]
+
+    @property
+    def port(self) -> int:
+        return self.udp_socket.getsockname()[1]
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.port}"
+
+    def set_records(self, name: str, type: str, *values: str):
+        self.records[(name.lower(), type)] = list(values)
+
+    def count(self, counter: str):
+        with self.lock:
+            self.request_counts[counter] += 1
+
+    def counters(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.request_counts)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.udp_socket.close()
+        self.tcp_socket.close()
+
+    def serve_udp(self):
+        while True:
+            try:
+                data, address = self.udp_socket.recvfrom(65535)
+            except OSError:
+                return
+            self.count("udp_queries")
+            response = self.answer(data, tcp=False)
+            if response is not None:
+                self.udp_socket.sendto(response, address)
+
+    def serve_tcp(self):
+        while True:
+            try:
+                connection, _ = self.tcp_socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle_tcp, args=(connection,), daemon=True).start()
+
+    def handle_tcp(self, connection: socket.socket):
+        with connection:
+            data = b""
+            while len(data) < 2 or len(data) < 2 + struct.unpack("!H", data[:2])[0]:
+                chunk = connection.recv(65535)
+                if not chunk:
+                    return
+                data += chunk
+            self.count("tcp_queries")
+            response = self.answer(data[2:], tcp=True)
+            if response is not None:
+                connection.sendall(struct.pack("!H", len(response)) + response)
+
+    @staticmethod
+    def encode_name(name: str, question_name: str = "") -> bytes:
+        # a name under the question name points at it (offset 12), like servers compress rdata
+        if question_name and name != question_name and name.endswith("." + question_name):
+            prefix = name[:-len(question_name) - 1]
+            return b"".join(bytes([len(label)]) + label.encode() for label in prefix.split(".")) + b"\xc0\x0c"
+        return b"".join(bytes([len(label)]) + label.encode() for label in name.split(".") if label) + b"\x00"
+
+    def encode_rdata(self, type: str, value: str, question_name: str) -> bytes:
+        if type == "A":
+            return ipaddress.IPv4Address(value).packed
+        if type == "AAAA":
+            return ipaddress.IPv6Address(value).packed
+        if type in ("NS", "CNAME"):
+            return self.encode_name(value.lower().rstrip("."), question_name)
+        data = value.encode()
+        # TXT values longer than 255 bytes are split into several strings
+        return b"".join(bytes([len(data[start:start + 255])]) + data[start:start + 255]
+                        for start in range(0, max(len(data), 1), 255))
+
+    def answer(self, query: bytes, tcp: bool) -> bytes:
+        if self.silent:
+            return None
+        query_id, flags, _, _, _, arcount = struct.unpack("!HHHHHH", query[:12])
+        labels, offset = [], 12
+        while query[offset]:
+            labels.append(query[offset + 1:offset + 1 + query[offset]].decode())
+            offset += 1 + query[offset]
+        offset += 1
+        type_code, _ = struct.unpack("!HH", query[offset:offset + 4])
+        question = query[12:offset + 4]
+        name, type = ".".join(labels).lower(), TYPES.get(type_code, "")
+        if arcount:
+            self.count("edns_queries")
+
+        rcode, answers = 0, []
+        if arcount and not self.edns:
+            # an old server that does not know the OPT record
+            rcode = 1
+        elif not any(owner == name for owner, _ in self.records):
+            rcode = 3
+        elif not tcp and self.truncate_udp:
+            # too long for UDP, only the header with the TC bit
+            flags |= 0x0200
+        else:
+            answers = self.records.get((name, type), [])
+        flags = 0x8000 | (flags & 0x0300) | (0x0400 if self.authoritative else 0) | rcode
+        response = struct.pack("!HHHHHH", query_id, flags, 1, len(answers), 0, 0) + question
+        for value in answers:
+            rdata = self.encode_rdata(type, value, name)
+            response += b"\xc0\x0c" + struct.pack("!HHIH", type_code, 1, 300, len(rdata)) + rdata
+        return response
@@ -0,0 +1,93 @@
+import re
+import time
+import socket
+import threading
+import paramiko
+
+
+class FakeRouterServer(paramiko.ServerInterface):
+
+    def __init__(self, router) -> None:
+        self.router: FakeRouter = router
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        # only understands echo "<key>=$(nvram get <key>)" commands joined by ";"
+        output = ""
+        for part in command.decode().split(";"):
+            match = re.fullmatch(r'\s*echo "(\w+)=\$\(nvram get (\w+)\)"\s*', part)
+            if match:
+                output += f"{match[1]}={self.router.nvram.get(match[2], '')}\n"
+        with self.router.lock:
+            self.router.commands += 1
+        threading.Thread(target=self.reply, args=(channel, output), daemon=True).start()
+        return True
+
+    @staticmethod
+    def reply(channel: paramiko.Channel, output: str):
+        # the client has to see the exec request accepted before any output
+        time.sleep(0.005)
+        channel.sendall(output.encode())
+        channel.send_exit_status(0)
+        channel.close()
+
+
+class FakeRouter:
+
+    def __init__(self, wan_ip: str = "1.2.3.4") -> None:
+        self.nvram: dict[str, str] = {"wan0_ipaddr": wan_ip, "wan0_realip_ip": wan_ip}
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.lock = threading.Lock()
+        self.handshakes: int = 0
+        self.commands: int = 0
+        self.socket = socket.socket()
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.socket.listen(16)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.socket.getsockname()[1]
+
+    def set_wan_ip(self, wan_ip: str):
+        self.nvram["wan0_ipaddr"] = self.nvram["wan0_realip_ip"] = wan_ip
+
+    def start(self):
+        self.thread.start()
+
+    def serve_forever(self):
+        while True:
+            try:
+                connection, _ = self.socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def handle(self, connection: socket.socket):
+        transport = paramiko.Transport(connection)
+        transport.add_server_key(self.host_key)
+        transport.start_server(server=FakeRouterServer(self))
+        with self.lock:
+            self.handshakes += 1
+        # accepted channels are kept referenced, a collected channel gets closed
+        channels = []
+        while transport.is_active():
+            channel = transport.accept(1)
+            if channel is not None:
+                channels.append(channel)
+
+    def counters(self) -> dict[str, int]:
+        with self.lock:
+            return {"ssh_handshakes": self.handshakes, "ssh_commands": self.commands}
+
+    def stop(self):
+        self.socket.close()
@@ -0,0 +1,218 @@
+import sys
+import json
+import time
+import types
+import asyncio
+import logging
+import pathlib
+import argparse
+import resource
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = pathlib.Path(__file__).absolute().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_apis import FakeApiServer, FakeCloudflareHandler, FakeGodaddyHandler
+from fake_router import FakeRouter
+from fake_gateway import FakeGateway
+
+
+SIZES: tuple[int, ...] = (1, 10, 100, 1000)
+PROVIDERS: tuple[str, ...] = ("cloudflare", "godaddy")
+# "single": one zone holding every record, driven by DDNSTask.main() like DDNSTask.run() does
+# "multi": zones of ZONE_SIZE records sharing one event loop, like ddns_updater.py does
+MODES: tuple[str, ...] = ("single", "multi")
+# where the records get the address from: the SSH router, or the gateway over UPnP IGD / NAT-PMP
+SOURCES: tuple[str, ...] = ("router", "upnp", "natpmp")
+ZONE_SIZE: int = 10
+STEADY_CYCLES: int = 3
+COLUMNS: tuple[str, ...] = ("wall_ms", "requests", "connections", "ssh_handshakes", "ssh_commands",
+                            "upnp_requests", "natpmp_requests")
+
+
+class Benchmark:
+
+    def __init__(self, provider: str, mode: str, size: int, steady_cycles: int = STEADY_CYCLES,
+                 source: str = "router") -> None:
+        self.provider: str = provider
+        self.source: str = source
+        self.mode: str = mode
+        self.size: int = size
+        self.steady_cycles: int = steady_cycles
+        self.phases: list[dict] = []
+
+        if provider == "cloudflare":
+            self.api_server = FakeApiServer(FakeCloudflareHandler)
+        else:
+            self.api_server = FakeApiServer(FakeGodaddyHandler)
+        self.api_server.start()
+        self.router = FakeRouter(wan_ip="1.2.3.4")
+        self.router.start()
+        self.gateway = FakeGateway(wan_ip="1.2.3.4")
+        self.gateway.start()
+
+        # the observer reads the router credentials from local_utils.router_cfg,
+        # point it at the stand-in before anything imports it
+        router_cfg = types.ModuleType("local_utils.router_cfg")
+        router_cfg.router_username = "benchmark"
+        router_cfg.router_password = "benchmark"
+        router_cfg.router_hostname = "127.0.0.1"
+        router_cfg.router_port = self.router.port
+        sys.modules["local_utils.router_cfg"] = router_cfg
+
+        # every run starts cold, without the state of earlier runs
+        from state_store import StateStore
+        self.state_dir = tempfile.TemporaryDirectory()
+        StateStore.shared(path=pathlib.Path(self.state_dir.name).joinpath("state.sqlite3"))
+
+        from ddns_task import DDNSTask, DDNSTaskConfig
+        from ddns_engine import DDNSEngine
+        from local_utils import IPObserver, UPnPGateway, NATPMPGateway
+        self.observer: IPObserver = IPObserver.shared()
+        UPnPGateway.SSDP_PORT = self.gateway.ssdp_port
+        NATPMPGateway.PORT = self.gateway.natpmp_port
+        self.observer.configure_gateway("127.0.0.1")
+        self.tasks: list[DDNSTask] = []
+        zone_size = size if mode == "single" else ZONE_SIZE
+        for zone in range(0, size, zone_size):
+            task_configs = [DDNSTaskConfig(name=f"host{index}", type="A", source=source)
+                            for index in range(zone, min(size, zone + zone_size))]
+            self.tasks.append(DDNSTask(api_config=self.api_config(f"zone{zone // zone_size}"),
+                                       task_configs=task_configs))
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=DDNSEngine.MAX_CONCURRENCY))
+
+    def api_config(self, zone: str):
+        base = f"http://127.0.0.1:{self.api_server.port}"
+        if self.provider == "cloudflare":
+            from dns_api import CloudflareDNSApi, CloudflareDNSConfig
+            # the stand-ins have no request budget, measure the update path itself
+            CloudflareDNSApi.RATE_LIMIT = (10 ** 6, 10 ** 6)
+            return CloudflareDNSConfig(handler_class=CloudflareDNSApi, domain=zone + ".example",
+                                       token="benchmark", zone_id=zone, api_base=base + "/client/v4")
+        else:
+            from dns_api import GodaddyDNSApi, GodaddyDNSConfig
+            GodaddyDNSApi.RATE_LIMIT = (10 ** 6, 10 ** 6)
+            return GodaddyDNSConfig(handler_class=GodaddyDNSApi, use_proxy=False, domain=zone + ".example",
+                                    key="benchmark", secret="benchmark", api_base=base + "/v1")
+
+    def counters(self) -> dict[str, int]:
+        return self.api_server.counters() | self.router.counters() | self.gateway.counters()
+
+    def measure(self, phase: str, refresh: bool):
+        # cycles are normally further apart than the observer TTL
+        self.observer.invalidate()
+        before = self.counters()
+        start = time.perf_counter()
+        if self.mode == "single":
+            for task in self.tasks:
+                if refresh:
+                    task.refresh_dns_records()
+                task.main()
+        else:
+            self.loop.run_until_complete(self.multi_cycle(refresh))
+        wall_time = time.perf_counter() - start
+        after = self.counters()
+        self.phases.append({"phase": phase, "wall_ms": wall_time * 1000}
+                           | {key: after[key] - before[key] for key in after})
+
+    async def multi_cycle(self, refresh: bool):
+        async def cycle(task):
+            if refresh:
+                await task.async_refresh_dns_records()
+            await task.async_main()
+        await asyncio.gather(*(cycle(task) for task in self.tasks))
+
+    def run(self) -> dict:
+        # first cycle after a start, every record is read and pushed
+        self.measure("cold", refresh=True)
+        for _ in range(self.steady_cycles):
+            self.measure("steady", refresh=False)
+        # the address changes, every record is pushed again
+        self.router.set_wan_ip("5.6.7.8")
+        self.gateway.set_wan_ip("5.6.7.8")
+        self.measure("change", refresh=False)
+        self.loop.close()
+        return {"provider": self.provider, "source": self.source, "mode": self.mode, "records": self.size,
+                "zones": len(self.tasks), "phases": self.phases,
+                # kilobytes on Linux
+                "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def summarize(result: dict) -> list[dict]:
+    # steady cycles are averaged into one row
+    rows: dict[str, list[dict]] = {}
+    for phase in result["phases"]:
+        rows.setdefault(phase["phase"], []).append(phase)
+    return [{"phase": name} | {column: sum(phase[column] for phase in phases) / len(phases) for column in COLUMNS}
+            for name, phases in rows.items()]
+
+
+def print_table(results: list[dict]):
+    header = (f"{'provider':<11}{'source':<8}{'mode':<8}{'records':>8}{'zones':>7}  {'phase':<8}{'wall ms':>10}"
+              f"{'requests':>10}{'conns':>7}{'ssh hs':>8}{'ssh cmd':>9}{'gw req':>8}{'peak RSS MB':>13}")
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        for row in summarize(result):
+            gateway_requests = row["upnp_requests"] + row["natpmp_requests"]
+            print(f"{result['provider']:<11}{result['source']:<8}{result['mode']:<8}{result['records']:>8}"
+                  f"{result['zones']:>7}  {row['phase']:<8}{row['wall_ms']:>10.1f}{row['requests']:>10.1f}"
+                  f"{row['connections']:>7.1f}{row['ssh_handshakes']:>8.1f}{row['ssh_commands']:>9.1f}"
+                  f"{gateway_requests:>8.1f}{result['peak_rss_mb']:>13.1f}")
+
+
+def run_worker(provider: str, mode: str, size: int, source: str, steady_cycles: int, log: bool):
+    if not log:
+        logging.disable(logging.CRITICAL)
+    log_dir = ROOT.joinpath("logs")
+    existing_logs = set(log_dir.glob("*.log*"))
+    try:
+        result = Benchmark(provider, mode, size, steady_cycles, source).run()
+    finally:
+        # every zone gets its own (empty) log file, do not leave them behind
+        if not log:
+            for log_file in set(log_dir.glob("*.log*")) - existing_logs:
+                if log_file.stat().st_size == 0:
+                    log_file.unlink()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the DDNS update path")
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=PROVIDERS)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=("router",))
+    parser.add_argument("--steady-cycles", type=int, default=STEADY_CYCLES)
+    parser.add_argument("--log", action="store_true", help="keep the task logs (slower)")
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON lines")
+    parser.add_argument("--worker", nargs=4, metavar=("PROVIDER", "MODE", "SIZE", "SOURCE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        provider, mode, size, source = args.worker
+        run_worker(provider, mode, int(size), source, args.steady_cycles, args.log)
+        return
+
+    results = []
+    for provider in args.providers:
+        for source in args.sources:
+            for mode in args.modes:
+                for size in args.sizes:
+                    # one process per run, so the peak RSS belongs to that run alone
+                    command = [sys.executable, __file__, "--worker", provider, mode, str(size), source,
+                               "--steady-cycles", str(args.steady_cycles)] + (["--log"] if args.log else [])
+                    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+                    result = json.loads(output.strip().splitlines()[-1])
+                    results.append(result)
+                    if args.json:
+                        print(json.dumps(result), flush=True)
+    if not args.json:
+        print_table(results)
+
+
+if __name__ == "__main__":
+    main()
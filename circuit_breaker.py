@@ -0,0 +1,80 @@
+from __future__ import annotations
+import time
+import threading
+from typing import Literal
+
+from metrics import circuit_open
+
+
+BREAKER_STATE = Literal["closed", "open", "half-open"]
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+
+    # breakers are shared by every task using the same source or provider credential
+    _shared: dict[tuple, CircuitBreaker] = {}
+    _shared_lock = threading.Lock()
+
+    # consecutive timeouts before calls are skipped
+    THRESHOLD: int = 3
+    # calls are skipped this long, then a single trial call decides,
+    # every failed trial doubles the wait up to COOLDOWN_MAX
+    COOLDOWN: float = 60
+    COOLDOWN_MAX: float = 900
+
+    def __init__(self, name: str, threshold: int = THRESHOLD, cooldown: float = COOLDOWN) -> None:
+        self.name: str = name
+        self.threshold: int = threshold
+        self.cooldown: float = cooldown
+        self.lock = threading.Lock()
+        self.failures: int = 0
+        self.open_until: float = 0
+        self.trial_running: bool = False
+
+    @classmethod
+    def shared(cls, key: tuple, name: str) -> CircuitBreaker:
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(name)
+            return cls._shared[key]
+
+    @property
+    def state(self) -> BREAKER_STATE:
+        if self.failures < self.threshold:
+            return "closed"
+        return "open" if time.monotonic() < self.open_until or self.trial_running else "half-open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "half-open":
+                self.trial_running = True
+            return state != "open"
+
+    def record_success(self):
+        with self.lock:
+            if self.failures >= self.threshold:
+                circuit_open.set(0, breaker=self.name)
+            self.failures = 0
+            self.trial_running = False
+
+    def release(self):
+        # a trial call ended without telling either way (cancelled), the next call is the trial
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self) -> bool:
+        # returns whether calls are skipped from now on (it just opened, or a trial failed)
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures < self.threshold:
+                return False
+            cooldown = min(self.cooldown * 2 ** (self.failures - self.threshold), self.COOLDOWN_MAX)
+            self.open_until = time.monotonic() + cooldown
+            circuit_open.set(1, breaker=self.name)
+            return True
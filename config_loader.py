@@ -0,0 +1,139 @@
+from __future__ import annotations
+import json
+import pathlib
+import dataclasses
+from dataclasses import dataclass, field
+
+import dns_api
+from dns_api import AbstractDNSConfig
+from ddns_task import DDNSTask, DDNSTaskConfig
+
+
+# provider name in the config file -> (config class, handler class) in dns_api
+PROVIDERS: dict[str, tuple[str, str]] = {
+    "cloudflare": ("CloudflareDNSConfig", "CloudflareDNSApi"),
+    "godaddy": ("GodaddyDNSConfig", "GodaddyDNSApi"),
+}
+# top level settings, everything else in the file is a zone
+SETTINGS: dict[str, object] = {
+    "max_concurrency": 8,
+    "watch_local": False,
+    "metrics_port": 0,
+    "ip_echo_endpoints_v4": [],
+    "ip_echo_endpoints_v6": [],
+    "ip_echo_quorum": 1,
+    "gateway": "",
+    "trace_file": "",
+}
+
+
+@dataclass
+class ConfigDiff:
+    # zones by task name
+    added: dict[str, dict] = field(default_factory=dict)
+    removed: list[str] = field(default_factory=list)
+    # the API config changed, the zone gets a new handler
+    replaced: dict[str, dict] = field(default_factory=dict)
+    # only the record list changed
+    updated: dict[str, list[DDNSTaskConfig]] = field(default_factory=dict)
+    settings: dict[str, object] = field(default_factory=dict)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.replaced or self.updated or self.settings)
+
+
+class ConfigFile:
+
+    # how often the file is checked for changes (seconds)
+    POLL_INTERVAL: float = 5
+
+    def __init__(self, path: str | pathlib.Path) -> None:
+        self.path = pathlib.Path(path)
+        self.signature: tuple[int, int] = None
+        self.settings: dict[str, object] = {}
+        self.zones: dict[str, dict] = {}
+
+    def stat_signature(self) -> tuple[int, int]:
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self) -> bool:
+        return self.stat_signature() != self.signature
+
+    def read(self) -> dict:
+        if self.path.suffix == ".json":
+            return json.loads(self.path.read_text())
+        # only .toml files need Python 3.11, configs.json and configs.py work on older ones
+        try:
+            import tomllib
+        except ModuleNotFoundError:
+            raise RuntimeError(f"Reading {self.path.name} needs Python 3.11 or newer (tomllib), "
+                               f"use configs.json with the same layout instead") from None
+        with open(self.path, "rb") as file:
+            return tomllib.load(file)
+
+    @staticmethod
+    def parse_zone(zone: dict) -> dict:
+        zone = dict(zone)
+        provider = str(zone.pop("provider", "")).lower()
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown provider \"{provider}\" for zone \"{zone.get('domain', '')}\", "
+                             f"expected one of {', '.join(PROVIDERS)}")
+        config_name, handler_name = PROVIDERS[provider]
+        config_class = getattr(dns_api, config_name)
+        records = zone.pop("record", [])
+        fields = {config_field.name for config_field in dataclasses.fields(config_class)} - {"handler_class"}
+        unknown = set(zone) - fields
+        if unknown:
+            raise ValueError(f"Unknown option(s) {', '.join(sorted(unknown))} for {provider} zone "
+                             f"\"{zone.get('domain', '')}\"")
+        api_config: AbstractDNSConfig = config_class(handler_class=getattr(dns_api, handler_name), **zone)
+        task_configs = [DDNSTaskConfig(**record) for record in records]
+        for task_config in task_configs:
+            task_config.validate()
+        keys = [(task_config.name, task_config.type) for task_config in task_configs]
+        if len(set(keys)) != len(keys):
+            raise ValueError(f"Duplicated records in zone \"{api_config.domain}\"")
+        return {"api": api_config, "task": task_configs}
+
+    def parse(self, content: dict) -> tuple[dict[str, object], dict[str, dict]]:
+        content = dict(content)
+        zones = content.pop("zone", [])
+        unknown = set(content) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown setting(s) {', '.join(sorted(unknown))}")
+        settings = {name: content.get(name, default) for name, default in SETTINGS.items()}
+        parsed_zones: dict[str, dict] = {}
+        for zone in zones:
+            ddns_config = self.parse_zone(zone)
+            zone_name = DDNSTask.zone_name(ddns_config["api"])
+            if zone_name in parsed_zones:
+                raise ValueError(f"Zone {zone_name} is configured twice")
+            parsed_zones[zone_name] = ddns_config
+        return settings, parsed_zones
+
+    def load(self) -> ConfigDiff:
+        # reads the file again and returns what changed since the last load,
+        # the running config is kept when the new one does not parse
+        signature = self.stat_signature()
+        settings, zones = self.parse(self.read())
+        diff = ConfigDiff(settings={name: value for name, value in settings.items()
+                                    if self.settings.get(name, SETTINGS[name]) != value or not self.signature})
+        for zone_name, ddns_config in zones.items():
+            current = self.zones.get(zone_name)
+            if current is None:
+                diff.added[zone_name] = ddns_config
+            elif current["api"] != ddns_config["api"]:
+                diff.replaced[zone_name] = ddns_config
+            elif current["task"] != ddns_config["task"]:
+                diff.updated[zone_name] = ddns_config["task"]
+        diff.removed = [zone_name for zone_name in self.zones if zone_name not in zones]
+        self.signature, self.settings, self.zones = signature, settings, zones
+        return diff
+
+    @property
+    def config_list(self) -> list[dict]:
+        return list(self.zones.values())
@@ -11,6 +11,23 @@ from dns_api import CloudflareDNSConfig, CloudflareDNSApi
 from ddns_task import DDNSTaskConfig
 
 
+# upper bound of lookups / API requests running at the same time, across all zones
+max_concurrency: int = 8
+# react to local address changes right away (Linux netlink), polling becomes a slow safety net
+watch_local: bool = False
+# serve Prometheus metrics on http://127.0.0.1:<port>/metrics, 0 to disable
+metrics_port: int = 0
+# for the "http" source, services answering with the public address as plain text (empty for built-in ones),
+# several are asked at once and the first answer is taken, or the first <quorum> agreeing ones
+ip_echo_endpoints_v4: list[str] = []
+ip_echo_endpoints_v6: list[str] = []
+ip_echo_quorum: int = 1
+# for the "upnp" / "natpmp" sources, address of the gateway to ask, empty to find it (SSDP / default route)
+gateway: str = ""
+# write a span per cycle phase, API request and source read to this file (JSON lines), empty to disable,
+# summarized by trace_summary.py
+trace_file: str = ""
+
 config_list: list[AbstractDNSConfig] = [
     # list of DNS targets (zones, which is a set of records for a certain domain)
     # each dict is config for one target
@@ -20,7 +37,9 @@ config_list: list[AbstractDNSConfig] = [
             use_proxy=False,
             domain="example.com",
             token="example_token",
-            zone_id="example_zone_id"
+            zone_id="example_zone_id",
+            # check the records over plain DNS first, the API is only read on a mismatch
+            verify_dns=True
         ),
         "task": [
             # list of tasks (get IP from where and set to which record)
@@ -30,17 +49,28 @@ config_list: list[AbstractDNSConfig] = [
                 type="AAAA",
                 source="local"
             ),
+            # "upnp" / "natpmp" ask the gateway for its WAN address without a login, instead of "router" over SSH
             DDNSTaskConfig(
                 name="example",
                 type="A",
                 source="router"
             ),
+            # another host on the LAN, its address follows this host's current IPv6 prefix
+            DDNSTaskConfig(
+                name="nas",
+                type="AAAA",
+                source="prefix",
+                suffix="::211:22ff:fe33:4455",
+                prefix_length=64
+            ),
         ]
     },
     {
         "api": GodaddyDNSConfig(
             handler_class=GodaddyDNSApi,
             use_proxy=True,
+            # only this zone's API traffic goes through it
+            proxy="socks5://localhost:10808",
             domain="example.com",
             key="example_key",
             secret="example_secret"
@@ -0,0 +1,251 @@
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from logger import TaskLogger
+from ddns_task import DDNSTask, DDNSTaskBoard, DDNSTaskConfig, LOCAL_SOURCES
+from config_loader import ConfigFile, ConfigDiff
+from scheduler import Scheduler, SchedulePolicy
+from local_utils import IPObserver
+from local_utils.netlink_watcher import NetlinkWatcher
+from metrics import MetricsServer, record_seconds_since_sync
+from tracing import tracer
+
+
+class DDNSEngine:
+
+    # upper bound of blocking calls (HTTP, SSH, netifaces) running at the same time
+    MAX_CONCURRENCY: int = 8
+    # every record is checked on its own timer
+    RECORD_POLICY = SchedulePolicy(interval=90, jitter=30)
+    # with address change events, records with local sources just poll as a safety net
+    WATCHED_RECORD_POLICY = SchedulePolicy(interval=750, jitter=150)
+    # re-reading the whole zone from the DNS API, this is just for some randomness,
+    # some proxy service seems to be not very happy with a constant interval network traffic...
+    REFRESH_POLICY = SchedulePolicy(interval=5400, jitter=1800, fast_checks=0)
+    # wait for the new address to settle (DAD, several events in a row) before reading it
+    SETTLE_DELAY: float = 0.2
+    # retry delay for keys that came due while their task was still busy
+    BUSY_DELAY: float = 1
+
+    def __init__(self, tasks: list[DDNSTask], max_concurrency: int = MAX_CONCURRENCY,
+                 watch_local: bool = False, metrics_port: int = 0, config_file: ConfigFile = None) -> None:
+        self.logger = TaskLogger(name="Updater")
+        self.tasks: list[DDNSTask] = tasks
+        self.max_concurrency: int = max_concurrency
+        self.watch_local: bool = watch_local
+        self.watcher: NetlinkWatcher = None
+        self.metrics_port: int = metrics_port
+        self.metrics_server: MetricsServer = None
+        self.watched_interfaces: dict[DDNSTask, set[str]] = {}
+        # one scheduler for all tasks, keys are (task, board) for records and (task, None) for zone refreshes
+        self.scheduler = Scheduler()
+        self.busy: set[DDNSTask] = set()
+        self.cycles: set[asyncio.Task] = set()
+        self.wake_signal: asyncio.Event = None
+        # declarative config watched for changes, tasks are added, removed or updated in place
+        self.config_file: ConfigFile = config_file
+
+    def record_policy(self, task_board: DDNSTaskBoard) -> SchedulePolicy:
+        if self.watcher and task_board.config.source in LOCAL_SOURCES:
+            return self.WATCHED_RECORD_POLICY
+        return self.RECORD_POLICY
+
+    def on_address_change(self, interface: str):
+        # runs in the event loop, scheduled by the watcher thread
+        for source in LOCAL_SOURCES:
+            IPObserver.shared().invalidate_source(source)
+        for task, interfaces in self.watched_interfaces.items():
+            if interface in interfaces:
+                for task_board in task.tasks:
+                    if task_board.config.source in LOCAL_SOURCES:
+                        self.scheduler.wake((task, task_board), delay=self.SETTLE_DELAY)
+        self.wake_signal.set()
+
+    def start_watcher(self, loop: asyncio.AbstractEventLoop):
+        self.watched_interfaces = {task: task.local_interfaces() for task in self.tasks}
+        interfaces = set().union(*self.watched_interfaces.values())
+        if not interfaces:
+            return
+        watcher = NetlinkWatcher(task_logger=IPObserver.shared().logger,
+                                 callback=lambda interface: loop.call_soon_threadsafe(self.on_address_change, interface),
+                                 interfaces=interfaces)
+        if watcher.start():
+            self.watcher = watcher
+
+    def update_watcher(self):
+        if not self.watch_local:
+            return
+        if self.watcher is None:
+            self.start_watcher(asyncio.get_running_loop())
+            return
+        self.watched_interfaces = {task: task.local_interfaces() for task in self.tasks}
+        # swapped as a whole, the watcher thread only reads it
+        self.watcher.interfaces = set().union(*self.watched_interfaces.values())
+
+    def add_task(self, task: DDNSTask):
+        self.tasks.append(task)
+        # the zone is read first, then every record is checked,
+        # unless every record is known from the last run
+        self.scheduler.add((task, None), self.REFRESH_POLICY,
+                           delay=self.REFRESH_POLICY.next_delay() if task.warm_started else 0)
+        for task_board in task.tasks:
+            self.scheduler.add((task, task_board), self.record_policy(task_board))
+
+    def remove_task(self, task: DDNSTask):
+        # a cycle still running finishes, its report is ignored
+        self.tasks.remove(task)
+        self.watched_interfaces.pop(task, None)
+        self.scheduler.remove((task, None))
+        for task_board in task.tasks:
+            self.scheduler.remove((task, task_board))
+            record_seconds_since_sync.remove(task=task.task_name, name=task_board.config.name,
+                                             type=task_board.config.type)
+        if task not in self.busy:
+            task.api_handler.close()
+
+    def update_task(self, task: DDNSTask, task_configs: list[DDNSTaskConfig]):
+        added, removed = task.update_task_configs(task_configs)
+        for task_board in removed:
+            self.scheduler.remove((task, task_board))
+            if (task_board.config.name, task_board.config.type) not in ((config.name, config.type)
+                                                                        for config in task_configs):
+                record_seconds_since_sync.remove(task=task.task_name, name=task_board.config.name,
+                                                 type=task_board.config.type)
+        for task_board in added:
+            self.scheduler.add((task, task_board), self.record_policy(task_board))
+        if not all(task.is_known(task_board) for task_board in added):
+            # new records are looked up together with the next zone read, right now
+            self.scheduler.wake((task, None))
+
+    async def apply_config_diff(self, diff: ConfigDiff):
+        tasks = {task.task_name: task for task in self.tasks}
+        for zone_name in diff.removed + list(diff.replaced):
+            self.remove_task(tasks[zone_name])
+            self.logger.warning(f"DDNS task <{zone_name}> removed")
+        for ddns_config in list(diff.replaced.values()) + list(diff.added.values()):
+            # new handlers share the transports (connections) of the old ones, records come from the state store
+            task = await asyncio.to_thread(DDNSTask, api_config=ddns_config["api"], task_configs=ddns_config["task"])
+            self.add_task(task)
+        for zone_name, task_configs in diff.updated.items():
+            self.update_task(tasks[zone_name], task_configs)
+        if diff.added or diff.replaced or diff.updated:
+            self.update_watcher()
+        for name, value in diff.settings.items():
+            if name.startswith("ip_echo_"):
+                IPObserver.shared().configure_http(endpoints_v4=self.config_file.settings["ip_echo_endpoints_v4"],
+                                                   endpoints_v6=self.config_file.settings["ip_echo_endpoints_v6"],
+                                                   quorum=self.config_file.settings["ip_echo_quorum"])
+            elif name == "gateway":
+                IPObserver.shared().configure_gateway(value)
+            elif name == "trace_file":
+                tracer.configure(value)
+            else:
+                self.logger.warning(f"Setting {name} changed to {value!r}, it takes effect after a restart")
+        self.wake_signal.set()
+
+    async def watch_config(self):
+        while True:
+            await asyncio.sleep(self.config_file.POLL_INTERVAL)
+            if not self.config_file.changed():
+                continue
+            try:
+                diff = await asyncio.to_thread(self.config_file.load)
+            except Exception as e:
+                self.logger.warning(f"Failed to reload {self.config_file.path.name}, keeping the running config: {e}")
+                # not retried until the file changes again
+                self.config_file.signature = self.config_file.stat_signature()
+                continue
+            if diff:
+                self.logger.warning(f"Reloading {self.config_file.path.name}: {len(diff.added)} zone(s) added, "
+                                    f"{len(diff.removed)} removed, {len(diff.replaced)} replaced, "
+                                    f"{len(diff.updated)} with changed records")
+                await self.apply_config_diff(diff)
+
+    async def run_cycle(self, task: DDNSTask, refresh: bool, task_boards: list[DDNSTaskBoard]):
+        try:
+            # one trace per cycle, refresh and main are its children
+            with tracer.span("cycle", zone=task.task_name, refresh=refresh, records=len(task_boards)):
+                if refresh:
+                    await task.async_refresh_dns_records()
+                changed = await task.async_main(task_boards) if task_boards else []
+        except Exception as e:
+            task.logger.warning(f"DDNS update attempt failed: {e}")
+            task.logger.error(f"\n\n{traceback.format_exc()}")
+            if refresh:
+                self.scheduler.report((task, None), "failed")
+            for task_board in task_boards:
+                self.scheduler.report((task, task_board), "failed")
+        else:
+            if refresh:
+                self.scheduler.report((task, None), "unchanged")
+            for task_board in task_boards:
+                if task_board in task.failed_tasks:
+                    self.scheduler.report((task, task_board), "failed")
+                else:
+                    self.scheduler.report((task, task_board), "changed" if task_board in changed else "unchanged")
+        finally:
+            self.busy.discard(task)
+            if task not in self.tasks:
+                # removed while this cycle was running
+                task.api_handler.close()
+            self.wake_signal.set()
+
+    def dispatch(self):
+        due_keys: dict[DDNSTask, list[DDNSTaskBoard]] = {}
+        for task, task_board in self.scheduler.pop_due():
+            if task in self.busy:
+                # one cycle per task at a time, come back once it is done
+                self.scheduler.schedule((task, task_board), self.BUSY_DELAY)
+                continue
+            due_keys.setdefault(task, []).append(task_board)
+        for task, task_boards in due_keys.items():
+            # records sharing a source with a due record go along, they share the reading anyway
+            # and their changes end up in the same batch
+            sources = {task_board.source_key for task_board in task_boards if task_board is not None}
+            for task_board in task.tasks:
+                if task_board.source_key in sources and self.scheduler.take((task, task_board)):
+                    task_boards.append(task_board)
+            self.busy.add(task)
+            refresh = None in task_boards
+            cycle = asyncio.create_task(self.run_cycle(task, refresh,
+                                                       [task_board for task_board in task_boards if task_board is not None]))
+            # keep a reference until it is done, the loop only holds weak ones
+            self.cycles.add(cycle)
+            cycle.add_done_callback(self.cycles.discard)
+
+    async def run(self):
+        # all zones share one event loop, blocking work goes to one bounded executor
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ddns")
+        loop.set_default_executor(executor)
+        self.wake_signal = asyncio.Event()
+        if self.watch_local:
+            self.start_watcher(loop)
+        if self.metrics_port:
+            self.metrics_server = MetricsServer(port=self.metrics_port)
+            self.metrics_server.start()
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            self.add_task(task)
+        config_watch = asyncio.create_task(self.watch_config()) if self.config_file else None
+
+        try:
+            while True:
+                self.dispatch()
+                try:
+                    await asyncio.wait_for(self.wake_signal.wait(), timeout=self.scheduler.time_until_next())
+                except asyncio.TimeoutError:
+                    pass
+                self.wake_signal.clear()
+        finally:
+            if config_watch:
+                config_watch.cancel()
+            if self.watcher:
+                self.watcher.stop()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        asyncio.run(self.run())
@@ -1,20 +1,29 @@
 import time
-import random
-import traceback
+import asyncio
+import ipaddress
 from copy import deepcopy
 from typing import Literal
 from dataclasses import dataclass
 
 from logger import TaskLogger
+from state_store import StateStore
+from metrics import cycle_seconds, record_changes_total, record_seconds_since_sync
+from circuit_breaker import CircuitOpen
+from tracing import tracer
 
-from local_utils import Localhost, AsusRouter
-from local_utils.router_cfg import router_username, router_password
+from local_utils import IPObserver, SourceReading
 
 from dns_api import RECORD_TYPE, AbstractDNSApi, AbstractDNSConfig
-from dns_api.utils import ProxyHelper, DNSRecord, DNSRecordQueryKey
+from dns_api.utils import DNSRecord, DNSRecordQueryKey, DNSRecordChange
 
+from reconciler import RecordStore, Reconciler, ChangePlan
 
-RECORD_SOURCE = Literal["local", "router"]
+
+RECORD_SOURCE = Literal["local", "router", "http", "prefix", "upnp", "natpmp"]
+# sources read from this host's interfaces
+LOCAL_SOURCES: tuple[str, ...] = ("local", "prefix")
+# sources asking the gateway over UPnP IGD / NAT-PMP, without credentials
+GATEWAY_SOURCES: tuple[str, ...] = ("upnp", "natpmp")
 
 
 @dataclass
@@ -22,155 +31,491 @@ class DDNSTaskConfig:
     name: str = "www"
     type: RECORD_TYPE = "AAAA"
     source: RECORD_SOURCE = "local"
-
-
-@dataclass
+    # local and prefix sources only, empty for the first wired interface
+    interface: str = ""
+    # prefix source only, the record gets the current prefix of the interface plus this host part,
+    # e.g. "::211:22ff:fe33:4455" for a LAN host, so one prefix change updates every such record
+    suffix: str = ""
+    prefix_length: int = 64
+
+    @property
+    def host_part(self) -> int:
+        # bits of the suffix below the prefix, the config is checked by validate()
+        return int(ipaddress.IPv6Address(self.suffix or "::")) & ((1 << (128 - self.prefix_length)) - 1)
+
+    def validate(self):
+        # raises ValueError for a record that could never be read, before it fails a whole zone's cycle
+        if self.source == "prefix":
+            if self.type != "AAAA":
+                raise ValueError(f"Source \"prefix\" only sets AAAA records, not {self.type} record {self.name}")
+            if not 0 < self.prefix_length < 128:
+                raise ValueError(f"Invalid prefix length {self.prefix_length} for record {self.name}")
+            try:
+                ipaddress.IPv6Address(self.suffix or "::")
+            except ValueError as e:
+                raise ValueError(f"Invalid suffix for record {self.name}: {e}")
+
+
+@dataclass(eq=False, slots=True)
 class DDNSTaskBoard:
-    local_record: DNSRecord
-    remote_record: DNSRecord
+    # the record's remote state lives in the task's record store, keyed by name and type
     config: DDNSTaskConfig
 
+    @property
+    def source_key(self) -> tuple:
+        return (self.config.source, self.config.type, self.config.interface)
+
+    @property
+    def record_key(self) -> tuple[str, str]:
+        return (self.config.name, self.config.type)
 
-class DDNSTask:
 
-    # This is just for some randomness, some proxy service 
-    # seems to be not very happy with a constant interval network traffic...
-    FORCE_FETCH_RAND_INTERVAL: tuple[int, int] = (40, 80)
+class DDNSTask:
 
     task_configs: list[DDNSTaskConfig]
 
+    # sources of one zone read at the same time
+    MAX_WORKERS: int = 4
+    # records whose source has not answered by then are skipped for this cycle (seconds)
+    CYCLE_DEADLINE: float = 20
+
     def __init__(self, api_config: AbstractDNSConfig, task_configs: list[DDNSTaskConfig]) -> None:
         self.domain: str = api_config.domain
-        self.task_name = (api_config.handler_class.__name__.rstrip("DNSApi")
-                          + "@\"" + api_config.domain + "\"")
+        self.task_name = self.zone_name(api_config)
         self.logger = TaskLogger(name=self.task_name)
         self.logger.warning(f"DDNS task <{self.task_name}> created!")
 
-        self.use_proxy: bool = api_config.use_proxy
-        self.proxy_helper = ProxyHelper(task_logger=self.logger)
         self.api_handler: AbstractDNSApi = api_config.handler_class(api_config, task_logger=self.logger)
-        self.local_handler: Localhost = Localhost(task_logger=self.logger)
-        self.router_handler: AsusRouter = AsusRouter(task_logger=self.logger,
-                                                     username=router_username,
-                                                     password=router_password)
-
-        self.task_configs = task_configs
-        self.tasks: list[DDNSTaskBoard] = []
-        for task_config in self.task_configs:
-            record_args = {"domain": self.domain, "name": task_config.name, "type": task_config.type}
-            self.tasks.append(DDNSTaskBoard(local_record=DNSRecord(**record_args),
-                                            remote_record=DNSRecord(**record_args),
-                                            config=task_config))
-
-        self.force_fetch_counter: int = 0
-
-    def fetch_dns_record(self, task_board: DDNSTaskBoard):
-        task_board.remote_record = self.api_handler.get_record(name=task_board.config.name,
-                                                               type=task_board.config.type)
+        # sources are read through the process-wide observer, shared with other tasks
+        self.observer: IPObserver = IPObserver.shared()
+        # observed state of the managed records
+        self.observed: RecordStore = RecordStore(domain=self.domain)
 
-    def push_dns_record(self, task_board: DDNSTaskBoard):
-        self.api_handler.set_record(record=task_board.local_record)
-        self.fetch_dns_record(task_board)
+        # records confirmed in the last run, so a restart does not need to read the zone first
+        self.state_store: StateStore = StateStore.shared()
+        stored_records = self.state_store.load_records(zone=self.task_name, domain=self.domain)
 
-    def remove_dns_record(self, task_board: DDNSTaskBoard):
-        self.api_handler.delete_record(name=task_board.config.name,
-                                       type=task_board.config.type)
-        self.fetch_dns_record(task_board)
-
-
-    def main(self):
+        self.task_configs = task_configs
+        self.tasks: list[DDNSTaskBoard] = [self.build_task_board(task_config, stored_records)
+                                           for task_config in self.task_configs]
+        self.warm_started: bool = all(self.is_known(task) for task in self.tasks)
+        if self.warm_started:
+            self.logger.info(f"Warm started with {len(self.tasks)} stored records")
+
+        # record changes collected during one main() cycle, submitted together
+        self.pending_changes: list[tuple[DDNSTaskBoard, DNSRecordChange]] = []
+        # records of the last cycle whose source could not be read
+        self.failed_tasks: list[DDNSTaskBoard] = []
+
+    @staticmethod
+    def zone_name(api_config: AbstractDNSConfig) -> str:
+        return api_config.handler_class.__name__.rstrip("DNSApi") + "@\"" + api_config.domain + "\""
+
+    def build_task_board(self, task_config: DDNSTaskConfig, stored_records: dict) -> DDNSTaskBoard:
+        task_config.validate()
+        task_board = DDNSTaskBoard(config=task_config)
+        # a record that never gets in sync ages from when it was configured
+        record_seconds_since_sync.setdefault(time.time(), task=self.task_name,
+                                             name=task_config.name, type=task_config.type)
+        if task_board.record_key in stored_records and not self.is_known(task_board):
+            self.observed.put(*task_board.record_key, stored_records[task_board.record_key])
+        return task_board
+
+    def update_task_configs(self, task_configs: list[DDNSTaskConfig]) -> tuple[list[DDNSTaskBoard], list[DDNSTaskBoard]]:
+        # returns the (added, removed) task boards, records are matched by name and type,
+        # unchanged ones keep their board and a changed source gets a new board, the remote state is kept
+        current = {task.record_key: task for task in self.tasks}
+        stored_records = self.state_store.load_records(zone=self.task_name, domain=self.domain)
+        tasks: list[DDNSTaskBoard] = []
+        added: list[DDNSTaskBoard] = []
+        removed: list[DDNSTaskBoard] = []
+        for task_config in task_configs:
+            task = current.pop((task_config.name, task_config.type), None)
+            if task is not None and task.config == task_config:
+                tasks.append(task)
+                continue
+            if task is not None:
+                removed.append(task)
+            new_task = self.build_task_board(task_config, stored_records)
+            tasks.append(new_task)
+            added.append(new_task)
+        for task in current.values():
+            removed.append(task)
+            self.observed.forget(*task.record_key)
+        # a cycle already running keeps the list it started with
+        self.task_configs, self.tasks = task_configs, tasks
+        self.logger.warning(f"Records reloaded, {len(added)} added or changed, {len(removed)} removed")
+        return added, removed
+
+    def is_known(self, task_board: DDNSTaskBoard) -> bool:
+        # whether the remote state of the record was read (or stored) before
+        return self.observed.known(*task_board.record_key)
+
+    def local_interfaces(self) -> set[str]:
+        return {self.observer.local_handler.find_interface(task.config.interface)
+                for task in self.tasks if task.config.source in LOCAL_SOURCES}
+
+    def fetch_dns_record(self, task_board: DDNSTaskBoard, use_cache: bool = True):
+        try:
+            if use_cache:
+                record = self.api_handler.get_cached_record(name=task_board.config.name, type=task_board.config.type)
+            else:
+                record = self.api_handler.get_record(name=task_board.config.name, type=task_board.config.type)
+        except Exception as e:
+            # only a successful lookup is kept (and saved), a failed one is not taken as a missing record
+            self.observed.forget(*task_board.record_key)
+            self.logger.warning(f"Failed to read {task_board.config.type} record for {task_board.config.name}, "
+                                f"left unknown until the next lookup: {e}")
+            return
+        self.observed.put(*task_board.record_key, record)
+
+    def take_pending_changes(self) -> list[tuple[DDNSTaskBoard, DNSRecordChange]]:
+        pending_changes, self.pending_changes = self.pending_changes, []
+        return pending_changes
+
+    def commit_dns_records(self):
+        pending_changes = self.take_pending_changes()
+        if pending_changes:
+            results = self.api_handler.apply_changes([change for _, change in pending_changes])
+            self.settle_dns_records(pending_changes, results)
+
+    async def async_commit_dns_records(self):
+        pending_changes = self.take_pending_changes()
+        if pending_changes:
+            results = await self.api_handler.async_apply_changes([change for _, change in pending_changes])
+            await asyncio.to_thread(self.settle_dns_records, pending_changes, results)
+
+    def settle_dns_records(self, pending_changes: list[tuple[DDNSTaskBoard, DNSRecordChange]], results: list):
+        for (task_board, change), result in zip(pending_changes, results):
+            record_changes_total.inc(task=self.task_name, action=change.action, result="ok" if result else "failed")
+            if result:
+                self.mark_synced(task_board)
+            if change.action == "set":
+                # the stored record comes back with the response, no need to read it again
+                if result:
+                    self.observed.put(*task_board.record_key, result)
+                    self.api_handler.record_cache.put(result)
+            else:
+                if result:
+                    self.observed.put(*task_board.record_key, None)
+                    self.api_handler.record_cache.discard(name=task_board.config.name,
+                                                          type=task_board.config.type)
+                else:
+                    self.fetch_dns_record(task_board, use_cache=False)
+        self.save_dns_records([task_board for task_board, _ in pending_changes])
+
+    def save_dns_records(self, task_boards: list[DDNSTaskBoard]):
+        # a record whose lookup failed is dropped from the store, a warm start reads it again
+        try:
+            self.state_store.save_records(self.task_name, [(*task_board.record_key,
+                                                            self.observed.record(*task_board.record_key))
+                                                           for task_board in task_boards
+                                                           if self.is_known(task_board)])
+            self.state_store.discard_records(self.task_name, [task_board.record_key for task_board in task_boards
+                                                              if not self.is_known(task_board)])
+        except Exception as e:
+            self.logger.warning(f"Failed to save DNS records state: {e}")
+
+
+    def mark_synced(self, task_board: DDNSTaskBoard):
+        record_seconds_since_sync.set_to_current_time(task=self.task_name,
+                                                      name=task_board.config.name,
+                                                      type=task_board.config.type)
+
+
+    def plan_dns_records(self, task_boards: list[DDNSTaskBoard], readings: list[SourceReading]) -> ChangePlan:
+        # desired state of the records from the source readings, against what the provider has
+        desired: dict[tuple[str, str], int | str | None] = {}
+        for task, reading in zip(task_boards, readings):
+            self.update_desired_state(desired, task, reading)
+        plan = Reconciler.plan(desired, self.observed)
+        if plan.lookups:
+            # records whose remote state is unknown are read first, then planned again
+            boards = {task.record_key: task for task in task_boards}
+            lookup_tasks = [boards[(item.name, item.type)] for item in plan.lookups]
+            for task in lookup_tasks:
+                self.fetch_dns_record(task)
+            self.save_dns_records(lookup_tasks)
+            plan = Reconciler.plan(desired, self.observed)
+        return plan
+
+    def queue_dns_records(self, task_boards: list[DDNSTaskBoard], plan: ChangePlan) -> list[DDNSTaskBoard]:
+        # returns the task boards which needed a change
+        boards = {task.record_key: task for task in task_boards}
+        changed: list[DDNSTaskBoard] = []
+        for item in plan.items:
+            task = boards[(item.name, item.type)]
+            if item.action == "noop":
+                if item.value != "":
+                    # only a record holding the value it should have counts as synced,
+                    # one left alone (private address, NAT) keeps aging
+                    self.logger.info(f"DDNS for {item.type} record {item.name} is up to date...")
+                    self.mark_synced(task)
+                continue
+            if item.action == "lookup":
+                self.logger.warning(f"DDNS for {item.type} record {item.name} is left for the next cycle, "
+                                    f"its current state could not be read")
+                self.failed_tasks.append(task)
+                continue
+            self.logger.warning(f"DDNS {item.action} for {item.type} record {item.name} is needed...")
+            self.pending_changes.append((task, plan.record_change(item)))
+            changed.append(task)
+        return changed
+
+    def dry_run(self) -> ChangePlan:
+        # the plan a cycle of every record would execute right now, nothing is written
+        return self.plan_dns_records(self.tasks, [self.read_source(task) for task in self.tasks])
+
+    def main(self, task_boards: list[DDNSTaskBoard] = None) -> list[DDNSTaskBoard]:
+        # returns the task boards which needed a change
+        task_boards = self.tasks if task_boards is None else task_boards
+        with (cycle_seconds.time(task=self.task_name),
+              tracer.span("main", zone=self.task_name, records=len(task_boards)) as span):
+            readings: dict[DDNSTaskBoard, SourceReading] = {}
+            with tracer.span("read_sources"):
+                for task in task_boards:
+                    try:
+                        with tracer.span("read_source", **self.source_attributes(task)):
+                            readings[task] = self.read_source(task)
+                    except Exception as e:
+                        self.log_read_failure([task], e)
+            self.failed_tasks = [task for task in task_boards if task not in readings]
+            read_tasks = list(readings)
+            with tracer.span("plan") as plan_span:
+                plan = self.plan_dns_records(read_tasks, list(readings.values()))
+                changed = self.queue_dns_records(read_tasks, plan)
+                plan_span.set(plan=plan.summary())
+            # submit every change of this cycle at once
+            with tracer.span("commit", changes=len(self.pending_changes)):
+                self.commit_dns_records()
+            span.set(changed=len(changed), failed=len(self.failed_tasks))
+        return changed
+
+    async def async_main(self, task_boards: list[DDNSTaskBoard] = None) -> list[DDNSTaskBoard]:
+        task_boards = self.tasks if task_boards is None else task_boards
+        with (cycle_seconds.time(task=self.task_name),
+              tracer.span("main", zone=self.task_name, records=len(task_boards)) as span):
+            # sources of all tasks are read concurrently, the zone is reconciled at once
+            # with the records whose source answered in time
+            with tracer.span("read_sources"):
+                readings = await self.async_read_sources(task_boards)
+            self.failed_tasks = [task for task in task_boards if task not in readings]
+            read_tasks = [task for task in task_boards if task in readings]
+            with tracer.span("plan") as plan_span:
+                # records of unknown state are looked up while planning, off the event loop
+                plan = await asyncio.to_thread(self.plan_dns_records,
+                                               read_tasks, [readings[task] for task in read_tasks])
+                changed = self.queue_dns_records(read_tasks, plan)
+                plan_span.set(plan=plan.summary())
+            with tracer.span("commit", changes=len(self.pending_changes)):
+                await self.async_commit_dns_records()
+            span.set(changed=len(changed), failed=len(self.failed_tasks))
+        return changed
+
+    async def async_read_sources(self, task_boards: list[DDNSTaskBoard]) -> dict[DDNSTaskBoard, SourceReading]:
+        # one read per distinct source, bounded by MAX_WORKERS and CYCLE_DEADLINE,
+        # a failing or hung source only leaves out the records reading it
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.CYCLE_DEADLINE
+        workers = asyncio.Semaphore(self.MAX_WORKERS)
+        sources: dict[tuple, list[DDNSTaskBoard]] = {}
+        for task in task_boards:
+            sources.setdefault(task.source_key, []).append(task)
+
+        async def read(task: DDNSTaskBoard) -> SourceReading:
+            with tracer.span("read_source", records=len(sources[task.source_key]), **self.source_attributes(task)):
+                breaker = self.observer.breaker(task.source_key)
+                if not breaker.allow():
+                    raise CircuitOpen("skipped after repeated timeouts")
+                started = False
+
+                async def read_in_slot() -> SourceReading:
+                    nonlocal started
+                    async with workers:
+                        started = True
+                        return await self.async_read_source(task)
 
-        # force fetching DNS record from DNS API
-        if not self.force_fetch_counter:
+                try:
+                    # the wait for a worker slot is bounded by the deadline too
+                    reading = await asyncio.wait_for(read_in_slot(), timeout=max(0, deadline - loop.time()))
+                except (asyncio.TimeoutError, TimeoutError):
+                    if not started:
+                        # never read, says nothing about the source
+                        raise TimeoutError(f"no free worker within {self.CYCLE_DEADLINE} seconds") from None
+                    # the deadline passed, or the source's own timeout (e.g. SSH) ran out
+                    if breaker.record_failure():
+                        self.logger.warning(f"Reads of {breaker.name} timed out {breaker.failures} times in a row, "
+                                            f"they are skipped for a while")
+                    if loop.time() >= deadline:
+                        raise TimeoutError(f"no answer within {self.CYCLE_DEADLINE} seconds") from None
+                    raise
+                except Exception:
+                    # the source answered, only timeouts count towards the breaker
+                    breaker.record_success()
+                    raise
+                else:
+                    breaker.record_success()
+                finally:
+                    breaker.release()
+                return reading
+
+        results = await asyncio.gather(*(read(tasks[0]) for tasks in sources.values()), return_exceptions=True)
+        readings: dict[DDNSTaskBoard, SourceReading] = {}
+        for tasks, result in zip(sources.values(), results):
+            if isinstance(result, Exception):
+                self.log_read_failure(tasks, result)
+            else:
+                readings.update(dict.fromkeys(tasks, result))
+        return readings
+
+    @staticmethod
+    def source_attributes(task: DDNSTaskBoard) -> dict:
+        return {"source": task.config.source, "type": task.config.type, "interface": task.config.interface}
+
+    def log_read_failure(self, task_boards: list[DDNSTaskBoard], error: Exception):
+        task = task_boards[0]
+        self.logger.warning(f"Failed to read {task.config.type} address from source \"{task.config.source}\", "
+                            f"{len(task_boards)} record(s) left for the next cycle: {error}")
+
+    def refresh_dns_records(self):
+        with tracer.span("refresh", zone=self.task_name, records=len(self.tasks)) as span:
+            if self.api_handler.verify_dns:
+                with tracer.span("verify"):
+                    verified = self.verify_dns_records()
+                span.set(verified=verified)
+                if verified:
+                    return
+            # force fetching DNS record from DNS API, the whole zone is listed at once
+            self.api_handler.refresh_records(force=True)
             for task in self.tasks:
                 self.fetch_dns_record(task_board=task)
-            self.force_fetch_counter = random.randint(*self.FORCE_FETCH_RAND_INTERVAL)
+            self.save_dns_records(self.tasks)
+        self.logger.info(f"API request budget utilization is {self.api_handler.budget_utilization():.0%}")
 
-        # iter through all tasks (different target records)
+    def verify_dns_records(self) -> bool:
+        # returns whether every record is confirmed by the authoritative nameservers
         for task in self.tasks:
-
-            if task.config.source == "local":
-
-                if task.config.type == "A":
-                    # get local running IP addresses
-                    current_ipv4 = self.local_handler.get_ipv4_ip()
-                    task.local_record.value = str(current_ipv4)
-                    self.logger.info(f"Local IPv4 address is {current_ipv4} "
-                                    f"({'is' if current_ipv4.is_private else 'not'} private)")
-                    # update DNS records if needed
-                    if not current_ipv4.is_private:
-                        if task.remote_record is None or str(current_ipv4) != task.remote_record.value:
-                            self.logger.warning(f"DDNS update for IPv4 is needed...")
-                            self.push_dns_record(task_board=task)
-                        else:
-                            self.logger.info(f"DDNS for IPv4 is up to date...")
-
-                elif task.config.type == "AAAA":
-                    # get local running IP addresses
-                    current_ipv6 = self.local_handler.get_ipv6_ip()
-                    task.local_record.value = str(current_ipv6)
-                    self.logger.info(f"Local IPv6 address is {current_ipv6} "
-                                    f"({'is' if current_ipv6.is_private else 'not'} private)")
-                    # update DNS records if needed
-                    if not current_ipv6.is_private:
-                        if task.remote_record is None or str(current_ipv6) != task.remote_record.value:
-                            self.logger.warning(f"DDNS update for IPv6 is needed...")
-                            self.push_dns_record(task_board=task)
-                        else:
-                            self.logger.info(f"DDNS for IPv6 is up to date...")
-
-            elif task.config.source == "router":
-
-                if task.config.type == "A":
-                    # get router running IP addresses
-                    current_wan_ipv4 = self.router_handler.get_wan_ip()
-                    current_real_ipv4 = self.router_handler.get_real_ip()
-                    task.local_record.value = str(current_real_ipv4)
-                    self.logger.info(f"Router IPv4 address is {current_wan_ipv4} "
-                                    f"({'is' if current_wan_ipv4.is_private else 'not'} private)")
-                    self.logger.info(f"Public IPv4 address is {current_real_ipv4} "
-                                    f"({'is' if current_real_ipv4.is_private else 'not'} private)")
-                    # check if the IP address is useable
-                    if current_wan_ipv4 != current_real_ipv4:
-                        # that means we don't have a public IPv4 address
-                        self.logger.info(f"DDNS for IPv4 is unavailable due to NAT address...")
-                        if task.remote_record and task.remote_record.value:
-                            self.remove_dns_record(task)
-                    elif current_real_ipv4.is_private:
-                        self.logger.info(f"DDNS for IPv4 is unavailable due to terrible NAT condition...")
-                        if task.remote_record and task.remote_record.value:
-                            self.remove_dns_record(task)
-                    else:
-                        # otherwise we have a valid public IPV4 address
-                        if task.remote_record is None or str(current_real_ipv4) != task.remote_record.value:
-                            self.logger.warning(f"DDNS update for router IPv4 is needed...")
-                            self.push_dns_record(task_board=task)
-                        else:
-                            self.logger.info(f"DDNS for router IPv4 is up to date...")
-                            
-                elif task.config.type == "AAAA":
-                    # get local running IP addresses
-                    self.logger.warning(f"Router IPv6 address should not be put into DDNS!")
+            stored = self.observed.get(*task.record_key)
+            if not self.is_known(task) or (stored is not None and (stored.value == ""
+                                                                   or (self.api_handler.RECORD_IDS and not stored.id))):
+                # nothing (or no id) known about it yet, only the API can tell
+                return False
+        results = self.api_handler.verify_records([(*task.record_key,
+                                                    (self.observed.record(*task.record_key) or DNSRecord()).value)
+                                                   for task in self.tasks])
+        mismatched = [task for task, result in zip(self.tasks, results) if not result]
+        if mismatched:
+            self.logger.warning(f"{len(mismatched)} record(s) could not be verified over DNS, "
+                                f"e.g. {mismatched[0].config.type} record for {mismatched[0].config.name}")
+            return False
+        self.logger.info(f"Verified {len(self.tasks)} record(s) over DNS")
+        self.save_dns_records(self.tasks)
+        return True
+
+    async def async_refresh_dns_records(self):
+        await asyncio.to_thread(self.refresh_dns_records)
+
+    def read_source(self, task: DDNSTaskBoard) -> SourceReading:
+        return self.observer.read(source=task.config.source,
+                                  type=task.config.type,
+                                  interface=task.config.interface)
+
+    async def async_read_source(self, task: DDNSTaskBoard) -> SourceReading:
+        return await self.observer.async_read(source=task.config.source,
+                                              type=task.config.type,
+                                              interface=task.config.interface)
+
+    def update_desired_state(self, desired: dict, task: DDNSTaskBoard, reading: SourceReading):
+        # sets the value the record should have, None if it should not exist,
+        # records left out are not touched
+
+        if task.config.source == "local":
+
+            if task.config.type == "A":
+                # get local running IP addresses
+                current_ipv4 = reading.address
+                self.logger.info(f"Local IPv4 address is {current_ipv4} "
+                                f"({'is' if current_ipv4.is_private else 'not'} private)")
+                # update DNS records if needed
+                if not current_ipv4.is_private:
+                    desired[task.record_key] = int(current_ipv4)
+
+            elif task.config.type == "AAAA":
+                # get local running IP addresses
+                current_ipv6 = reading.address
+                self.logger.info(f"Local IPv6 address is {current_ipv6} "
+                                f"({'is' if current_ipv6.is_private else 'not'} private)")
+                # update DNS records if needed
+                if not current_ipv6.is_private:
+                    desired[task.record_key] = int(current_ipv6)
+
+        elif task.config.source == "router":
+
+            if task.config.type == "A":
+                # get router running IP addresses
+                current_wan_ipv4 = reading.wan_address
+                current_real_ipv4 = reading.address
+                self.logger.info(f"Router IPv4 address is {current_wan_ipv4} "
+                                f"({'is' if current_wan_ipv4.is_private else 'not'} private)")
+                self.logger.info(f"Public IPv4 address is {current_real_ipv4} "
+                                f"({'is' if current_real_ipv4.is_private else 'not'} private)")
+                # check if the IP address is useable
+                if current_wan_ipv4 != current_real_ipv4:
+                    # that means we don't have a public IPv4 address
+                    self.logger.info(f"DDNS for IPv4 is unavailable due to NAT address...")
+                    desired[task.record_key] = None
+                elif current_real_ipv4.is_private:
+                    self.logger.info(f"DDNS for IPv4 is unavailable due to terrible NAT condition...")
+                    desired[task.record_key] = None
+                else:
+                    # otherwise we have a valid public IPV4 address
+                    desired[task.record_key] = int(current_real_ipv4)
+
+            elif task.config.type == "AAAA":
+                # get local running IP addresses
+                self.logger.warning(f"Router IPv6 address should not be put into DDNS!")
+
+        elif task.config.source == "prefix":
+
+            # the host part of the configured suffix under the prefix this host currently has
+            current_prefix = ipaddress.IPv6Network((reading.address, task.config.prefix_length), strict=False)
+            host_ipv6 = ipaddress.IPv6Address(int(current_prefix.network_address) | task.config.host_part)
+            self.logger.info(f"Local IPv6 prefix is {current_prefix} "
+                            f"({'is' if reading.address.is_private else 'not'} private)")
+            # update DNS records if needed
+            if not reading.address.is_private:
+                desired[task.record_key] = int(host_ipv6)
+
+        elif task.config.source in GATEWAY_SOURCES:
+
+            if task.config.type == "A":
+                # WAN address of the gateway, asked over UPnP IGD / NAT-PMP instead of a login
+                current_wan_ipv4 = reading.address
+                self.logger.info(f"Gateway IPv4 address is {current_wan_ipv4} "
+                                f"({'is' if current_wan_ipv4.is_global else 'not'} public)")
+                # check if the IP address is useable
+                if not current_wan_ipv4.is_global:
+                    # the gateway itself is behind another NAT (CGNAT / double NAT)
+                    self.logger.info(f"DDNS for IPv4 is unavailable due to NAT address...")
+                    desired[task.record_key] = None
+                else:
+                    desired[task.record_key] = int(current_wan_ipv4)
+
+            elif task.config.type == "AAAA":
+                self.logger.warning(f"Gateway sources only know the IPv4 address, use local / prefix for IPv6!")
+
+        elif task.config.source == "http":
+
+            # public address as seen by IP echo services, works behind any NAT device
+            current_ip = reading.address
+            self.logger.info(f"Public IPv{current_ip.version} address is {current_ip} "
+                            f"({'is' if current_ip.is_private else 'not'} private)")
+            # update DNS records if needed
+            if not current_ip.is_private:
+                desired[task.record_key] = int(current_ip)
 
 
     def run(self):
-
-        # do DDNS monitoring and updates
-        try:
-            if self.use_proxy:
-                self.proxy_helper.set_proxy()
-
-            while True:
-                try:
-                    self.main()
-                    time_sleep = random.randint(60, 120)
-                    time.sleep(time_sleep)
-                except Exception as e:
-                    self.logger.warning(f"DDNS update attempt failed: {e}")
-                    self.logger.error(f"\n\n{traceback.format_exc()}")
-        except:
-            self.logger.error(f"\n\n{traceback.format_exc()}")
-
-        finally:
-            if self.use_proxy:
-                self.proxy_helper.unset_proxy()
+        # do DDNS monitoring and updates for this task alone
+        from ddns_engine import DDNSEngine
+        DDNSEngine([self]).start()
@@ -1,22 +1,86 @@
-from multiprocessing.pool import ThreadPool
+import time
+started_at = time.perf_counter()
 
-from configs import config_list
+import sys
+import pathlib
+import argparse
+import resource
+from logger import TaskLogger
 from ddns_task import DDNSTask
+from ddns_engine import DDNSEngine
+from config_loader import ConfigFile, SETTINGS
+from local_utils import IPObserver
+from tracing import tracer
+
+
+# optional dependencies worth knowing about when looking at start time and memory
+HEAVY_MODULES: tuple[str, ...] = ("paramiko", "netifaces", "systemd.journal", "requests", "socks")
+# declarative configs, watched and reloaded while running, "configs.py" is used when none of them exists
+CONFIG_FILES: tuple[str, ...] = ("configs.toml", "configs.json")
+
+
+def load_configs() -> tuple[dict, list[dict], ConfigFile]:
+    for file_name in CONFIG_FILES:
+        path = pathlib.Path(__file__).absolute().parent.joinpath(file_name)
+        if path.exists():
+            config_file = ConfigFile(path)
+            config_file.load()
+            return config_file.settings, config_file.config_list, config_file
+    import configs
+    settings = {name: getattr(configs, name, default) for name, default in SETTINGS.items()}
+    return settings, configs.config_list, None
 
 
 if __name__ == "__main__":
 
-    pool = ThreadPool(processes=len(config_list))
+    parser = argparse.ArgumentParser(description="DDNS updater for Godaddy and Cloudflare")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the changes every zone needs right now, without writing them")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="write spans of every cycle to FILE (JSON lines), overrides the trace_file setting")
+    args = parser.parse_args()
+
+    settings, config_list, config_file = load_configs()
+    imported_at = time.perf_counter()
+    logger = TaskLogger(name="Updater")
+
+    IPObserver.shared().configure_http(endpoints_v4=settings["ip_echo_endpoints_v4"],
+                                       endpoints_v6=settings["ip_echo_endpoints_v6"],
+                                       quorum=settings["ip_echo_quorum"])
+    IPObserver.shared().configure_gateway(settings["gateway"])
+    # the setting is relative to this directory, the command line one to the working directory
+    tracer.configure(str(pathlib.Path(args.trace).absolute()) if args.trace else settings["trace_file"])
+
     task_list = []
 
     for ddns_config in config_list:
-    
+
         api_config = ddns_config["api"]
         task_configs = ddns_config["task"]
         task = DDNSTask(api_config=api_config, task_configs=task_configs)
         task_list.append(task)
 
-    pool.map(DDNSTask.run, task_list)
+    if args.dry_run:
+        for task in task_list:
+            if not task.warm_started:
+                task.refresh_dns_records()
+            print(task.dry_run().render())
+        sys.exit(0)
+
+    engine = DDNSEngine(task_list,
+                        max_concurrency=settings["max_concurrency"],
+                        watch_local=settings["watch_local"],
+                        metrics_port=settings["metrics_port"],
+                        config_file=config_file)
+
+    ready_at = time.perf_counter()
+    loaded = [module for module in HEAVY_MODULES if module in sys.modules]
+    logger.info(f"Started in {(ready_at - started_at) * 1000:.0f} ms "
+                f"(config and imports {(imported_at - started_at) * 1000:.0f} ms, "
+                f"{len(task_list)} task(s) {(ready_at - imported_at) * 1000:.0f} ms), "
+                f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB, "
+                f"loaded: {', '.join(loaded) or 'none'}")
+    if config_file:
+        logger.info(f"Watching {config_file.path.name} for changes")
 
-    pool.close()
-    pool.join()
+    engine.start()
@@ -1,4 +1,13 @@
 from .utils import RECORD_TYPE
 from .abstract_api import AbstractDNSConfig, AbstractDNSApi
-from .godaddy_api import GodaddyDNSConfig, GodaddyDNSApi
-from .cloudflare_api import CloudflareDNSConfig, CloudflareDNSApi
+
+
+# provider modules are only imported when a config refers to them
+def __getattr__(name: str):
+    if name in ("GodaddyDNSConfig", "GodaddyDNSApi"):
+        from . import godaddy_api
+        return getattr(godaddy_api, name)
+    if name in ("CloudflareDNSConfig", "CloudflareDNSApi"):
+        from . import cloudflare_api
+        return getattr(cloudflare_api, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
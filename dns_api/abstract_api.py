@@ -1,16 +1,45 @@
 from __future__ import annotations
+import asyncio
+import functools
+import ipaddress
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from abc import abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from logger import TaskLogger
-from .utils import RECORD_TYPE, DNSRecord
+from metrics import api_call_seconds, api_responses_total
+from tracing import tracer
+from .utils import RECORD_TYPE, DNSRecord, DNSRecordChange
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from .transport import ApiResponse, HttpTransport, TIMEOUT_ERRORS
+from .record_cache import RecordCache
+from .rate_limiter import RateLimiter, RateLimitExceeded
+from .dns_client import DNSClient
 
 
 @dataclass
 class AbstractDNSConfig:
     handler_class: AbstractDNSApi = None
     use_proxy: bool = False
+    # used for this handler's API traffic only, when use_proxy is set
+    proxy: str = "socks5://localhost:10808"
     domain: str = ""
     timeout: float = 10
+    # empty for the provider's public endpoint, or e.g. a local stand-in for benchmarks
+    api_base: str = ""
+    # HTTP transport settings (connection pool per provider endpoint)
+    pool_size: int = 4
+    max_retries: int = 2
+    retry_backoff: float = 0.5
+    # how long a zone-wide record snapshot is trusted (seconds)
+    cache_ttl: float = 300
+    # longest time a request may wait for the provider's request budget (seconds)
+    rate_limit_wait: float = 30
+    # confirm known records by asking the zone's authoritative nameservers (plain DNS, no API quota),
+    # the API is only read when something does not match
+    verify_dns: bool = False
+    # e.g. ["192.0.2.53", "[2001:db8::53]:5353"], empty to look up the zone's NS records
+    nameservers: list[str] = field(default_factory=list)
 
     def dict(self):
         return self.__dict__
@@ -18,10 +47,192 @@ class AbstractDNSConfig:
 
 class AbstractDNSApi:
 
+    API_BASE: str = ""
+    # sustained requests per second and burst size allowed by the provider
+    RATE_LIMIT: tuple[float, int] = (1, 60)
+    # whether the provider addresses records by id
+    RECORD_IDS: bool = True
+    # single record changes sent at once, a hung one does not hold up the others
+    CHANGE_WORKERS: int = 4
+    # handler methods whose latency is reported per provider
+    TIMED_METHODS: tuple[str, ...] = ("list_all_records", "get_record", "set_record",
+                                      "delete_record", "apply_changes", "refresh_records")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in cls.TIMED_METHODS:
+            method = getattr(cls, name)
+            if name in cls.__dict__ or not hasattr(method, "__wrapped__"):
+                setattr(cls, name, cls.timed(method))
+
+    @staticmethod
+    def timed(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with (api_call_seconds.time(provider=type(self).__name__, method=method.__name__),
+                  tracer.span(f"api.{method.__name__}", provider=type(self).__name__)):
+                return method(self, *args, **kwargs)
+        return wrapper
+
     def __init__(self, config: AbstractDNSConfig, task_logger: TaskLogger):
         self.domain = config.domain
         self.timeout = config.timeout
         self.logger = task_logger.getChild("API")
+        self.headers: dict = {}
+        api_base = config.api_base or self.API_BASE
+        proxy = config.proxy if config.use_proxy else ""
+        self.proxy: str = proxy
+        self.transport = HttpTransport.shared(base_url=api_base,
+                                              pool_size=config.pool_size,
+                                              max_retries=config.max_retries,
+                                              retry_backoff=config.retry_backoff,
+                                              proxy=proxy)
+        if config.use_proxy:
+            self.logger.info(f"API requests go through proxy \"{config.proxy}\"")
+        # timeouts come from the network path, so zones sharing the endpoint and proxy share the breaker
+        self.circuit_breaker = CircuitBreaker.shared(key=("provider", api_base, proxy),
+                                                     name=f"{type(self).__name__} {api_base}")
+        self.change_workers = ThreadPoolExecutor(max_workers=self.CHANGE_WORKERS,
+                                                 thread_name_prefix=f"{type(self).__name__}-changes")
+        self.record_cache = RecordCache(ttl=config.cache_ttl)
+        self.rate_limit_wait: float = config.rate_limit_wait
+        self.rate_limiter: RateLimiter = None
+        self.verify_dns: bool = config.verify_dns
+        self.nameservers: list[tuple[str, int]] = [DNSClient.parse_server(server) for server in config.nameservers]
+        self.dns_client = DNSClient()
+
+    def setup_rate_limiter(self, credential: str):
+        # one request budget per provider credential, no matter how many zones use it
+        rate, burst = self.RATE_LIMIT
+        self.rate_limiter = RateLimiter.shared(key=(type(self).__name__, credential),
+                                               rate=rate, burst=burst)
+
+    def request(self, method: str, path: str, **kwargs) -> ApiResponse:
+        with tracer.span("http.request", provider=type(self).__name__, method=method,
+                         path=path, proxy=self.proxy) as span:
+            response = self.send_request(method, path, **kwargs)
+            span.set(status=response.status_code, bytes=response.size, retries=response.retries)
+            return response
+
+    def send_request(self, method: str, path: str, **kwargs) -> ApiResponse:
+        # reads (force-fetches) leave room in the budget for writes
+        priority = "low" if method == "GET" else "high"
+        retries = 0
+        for attempt in range(2):
+            if self.rate_limiter and not self.rate_limiter.acquire(priority, timeout=self.rate_limit_wait):
+                raise RateLimitExceeded(f"No request budget left for {method} {path} "
+                                        f"within {self.rate_limit_wait} seconds")
+            if not self.circuit_breaker.allow():
+                raise CircuitOpen(f"{type(self).__name__} skipped {method} {path} after repeated timeouts")
+            try:
+                response = self.transport.request(method, path,
+                                                  headers=self.headers,
+                                                  timeout=self.timeout,
+                                                  **kwargs)
+            except Exception as e:
+                api_responses_total.inc(provider=type(self).__name__, method=method, status="error")
+                if isinstance(e, TIMEOUT_ERRORS) and self.circuit_breaker.record_failure():
+                    self.logger.warning(f"{type(self).__name__} timed out {self.circuit_breaker.failures} times in a row, "
+                                        f"requests are skipped for a while")
+                elif not isinstance(e, TIMEOUT_ERRORS):
+                    self.circuit_breaker.record_success()
+                raise
+            self.circuit_breaker.record_success()
+            api_responses_total.inc(provider=type(self).__name__, method=method, status=response.status_code)
+            if self.rate_limiter:
+                self.rate_limiter.update(response.status_code, response.headers, response.body)
+            if response.status_code != 429 or priority == "low":
+                break
+            # a write is worth one more try once the provider lets us in again
+            self.logger.warning(f"Rate limited by the provider on {method} {path}, retrying once...")
+            retries += response.retries + 1
+        response.retries += retries
+        return response
+
+    def close(self):
+        # the transport is shared with other handlers and stays open
+        self.change_workers.shutdown(wait=False)
+
+    def budget_utilization(self) -> float:
+        return self.rate_limiter.utilization() if self.rate_limiter else 0
+
+    def refresh_records(self, force: bool = False) -> bool:
+        if not force and self.record_cache.is_fresh:
+            return True
+        records = self.list_all_records()
+        if records is None:
+            return False
+        self.record_cache.load(records)
+        return True
+
+    def full_name(self, name: str) -> str:
+        return self.domain if name == "@" else name + "." + self.domain
+
+    def verify_records(self, expected: list[tuple[str, RECORD_TYPE, str]]) -> list[bool]:
+        # (name, type, value) with "" for a record that should not exist,
+        # None in the result where no nameserver answered
+        results: list[bool] = [None] * len(expected)
+        questions = [(self.full_name(name), type) for name, type, _ in expected]
+        servers = self.nameservers or self.dns_client.authoritative_servers(self.domain)
+        for server in servers:
+            pending = [index for index, result in enumerate(results) if result is None]
+            if not pending:
+                break
+            try:
+                responses = self.dns_client.query_many(server, [questions[index] for index in pending])
+            except OSError as e:
+                self.logger.warning(f"Failed to query nameserver {server[0]}:{server[1]}: {e}")
+                continue
+            for index, response in zip(pending, responses):
+                if response is None or response.rcode not in (DNSClient.RCODE_NOERROR, DNSClient.RCODE_NXDOMAIN):
+                    continue
+                # only an authoritative answer tells what the zone holds
+                if not response.authoritative and not self.nameservers:
+                    continue
+                name, type, value = expected[index]
+                values = response.values(*questions[index])
+                results[index] = values == ([self.normalize_value(type, value)] if value else [])
+        return results
+
+    @staticmethod
+    def normalize_value(type: RECORD_TYPE, value: str) -> str:
+        if type in ("A", "AAAA"):
+            try:
+                return str(ipaddress.ip_address(value))
+            except ValueError:
+                pass
+        return value.lower().rstrip(".") if type in ("CNAME", "NS") else value
+
+    def get_cached_record(self, name: str, type: RECORD_TYPE) -> DNSRecord:
+        if self.refresh_records():
+            return self.record_cache.get(name, type)
+        # zone snapshot unavailable, fall back to querying the single record
+        return self.get_record(name, type)
+
+    def apply_changes(self, changes: list[DNSRecordChange]) -> list:
+        # one result per change: the stored DNSRecord (or None) for "set", a bool for "delete"
+        # providers with a bulk API override this to submit everything at once
+        if len(changes) < 2:
+            return [self.apply_change(change) for change in changes]
+        # each worker runs in a copy of the caller's context, so its spans join the caller's trace
+        futures = [self.change_workers.submit(contextvars.copy_context().run, self.apply_change, change)
+                   for change in changes]
+        return [future.result() for future in futures]
+
+    def apply_change(self, change: DNSRecordChange) -> DNSRecord | bool:
+        # a failing change only fails itself
+        with tracer.span("change", provider=type(self).__name__, action=change.action,
+                         record=f"{change.record.type} {change.record.name}") as span:
+            try:
+                if change.action == "set":
+                    result = self.set_record(record=change.record)
+                else:
+                    result = self.delete_record(name=change.record.name, type=change.record.type, id=change.record.id)
+            except Exception as e:
+                self.logger.warning(f"Failed to {change.action} {change.record.type} record for {change.record.name}: {e}")
+                result = None if change.action == "set" else False
+            span.set(result="ok" if result else "failed")
+            return result
 
     @abstractmethod
     def list_all_records(self) -> list[DNSRecord]:
@@ -29,12 +240,20 @@ class AbstractDNSApi:
 
     @abstractmethod
     def get_record(self, name: str, type: RECORD_TYPE) -> DNSRecord:
+        # returns None if the record does not exist, raises LookupError if it could not be read
         pass
 
     @abstractmethod
-    def set_record(self, record: DNSRecord) -> bool:
+    def set_record(self, record: DNSRecord) -> DNSRecord:
+        # returns the record as stored by the provider, or None on failure
         pass
 
     @abstractmethod
-    def delete_record(self, name: str, type: RECORD_TYPE) -> bool:
+    def delete_record(self, name: str, type: RECORD_TYPE, id: str = "") -> bool:
         pass
+
+    # async variant, the blocking call is handed to the event loop's executor
+    # so the size of that executor bounds the number of requests in flight
+
+    async def async_apply_changes(self, changes: list[DNSRecordChange]) -> list:
+        return await asyncio.to_thread(self.apply_changes, changes)
@@ -1,7 +1,6 @@
-import requests
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from logger import TaskLogger
-from .utils import RECORD_TYPE, DNSRecord
+from .utils import RECORD_TYPE, DNSRecord, DNSRecordChange
 from .abstract_api import AbstractDNSConfig, AbstractDNSApi
 
 
@@ -13,7 +12,13 @@ class CloudflareDNSConfig(AbstractDNSConfig):
 
 
 class CloudflareDNSApi(AbstractDNSApi):
-    
+
+    API_BASE: str = "https://api.cloudflare.com/client/v4"
+    # 1200 requests per 5 minutes per user
+    RATE_LIMIT: tuple[float, int] = (4, 100)
+    PAGE_SIZE: int = 1000
+    BATCH_SIZE: int = 200
+
     def __init__(self, config: CloudflareDNSConfig, task_logger: TaskLogger):
         super().__init__(config, task_logger)
         self.token: str = config.token
@@ -21,22 +26,59 @@ class CloudflareDNSApi(AbstractDNSApi):
         self.headers: dict = {"Accept": "application/json",
                               "Content-Type": "application/json",
                               "Authorization": f"Bearer {self.token}"}
+        self.setup_rate_limiter(credential=self.token)
+
+    def relative_name(self, full_name: str) -> str:
+        if full_name == self.domain:
+            return "@"
+        return full_name.removesuffix("." + self.domain)
+
+    def parse_record(self, result: dict) -> DNSRecord:
+        return DNSRecord(domain=self.domain,
+                         name=self.relative_name(result["name"]),
+                         type=result["type"],
+                         id=result["id"],
+                         value=result["content"],
+                         ttl=result["ttl"],
+                         comment=result.get("comment"))
+
+    def list_all_records(self) -> list[DNSRecord]:
+        records: list[DNSRecord] = []
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            response = self.request("GET", f"zones/{self.zone_id}/dns_records",
+                                    params={"page": page, "per_page": self.PAGE_SIZE})
+            try:
+                if response.status_code == 200 and response.body["success"]:
+                    self.logger.debug(response.body)
+                    for result in response.body["result"]:
+                        records.append(self.parse_record(result))
+                    total_pages = response.body["result_info"]["total_pages"]
+                    page += 1
+                else:
+                    self.logger.warning(f"Failed to list records (page {page}):\n"
+                                        f"Status Code: {response.status_code}\n"
+                                        f"Json Content: {response.body}")
+                    return None
+            except Exception as e:
+                self.logger.warning(f"Failed to list records (page {page}):\n"
+                                    f"Status Code: {response.status_code}\n"
+                                    f"Json Content: {response.body}\n"
+                                    f"Exception: {e}")
+                return None
+        self.logger.info(f"Succeeded to list {len(records)} records in {total_pages} page(s)")
+        return records
 
     def get_record(self, name: str, type: RECORD_TYPE) -> DNSRecord:
         full_name = name + "." + self.domain
-        uri = (f"https://api.cloudflare.com/client/v4/"
-               f"zones/{self.zone_id}/"
-               f"dns_records?name={full_name}&type={type}")
-        response = requests.get(url=uri,
-                                headers=self.headers,
-                                timeout=self.timeout)
+        response = self.request("GET", f"zones/{self.zone_id}/dns_records",
+                                params={"name": full_name, "type": type})
         try:
-            if response.status_code == 200 and response.json()["success"]:
+            if response.status_code == 200 and response.body["success"]:
                 self.logger.info(f"Succeeded to get {type} record for {name}")
-                response_json = response.json()
-                self.logger.debug(response_json)
-                if len(response_json["result"]) > 0:
-                    result = response_json["result"][0]
+                self.logger.debug(response.body)
+                if len(response.body["result"]) > 0:
+                    result = response.body["result"][0]
                     return DNSRecord(domain=self.domain, name=name, type=type,
                                      id=result["id"],
                                      value=result["content"],
@@ -48,82 +90,158 @@ class CloudflareDNSApi(AbstractDNSApi):
             else:
                 self.logger.warning(f"Failed to fetch {type} record for {name}:\n"
                                     f"Status Code: {response.status_code}\n"
-                                    f"Json Content: {response.json()}")
-                return None
+                                    f"Json Content: {response.body}")
         except Exception as e:
             self.logger.warning(f"Failed to fetch {type} record for {name}:\n"
                                 f"Status Code: {response.status_code}\n"
-                                f"Json Content: {response.json()}\n"
+                                f"Json Content: {response.body}\n"
                                 f"Exception: {e}")
-            return None
+        # None is kept for a record confirmed missing
+        raise LookupError(f"Failed to fetch {type} record for {name}")
 
-    def set_record(self, record: DNSRecord) -> bool:
-        record_to_update = self.get_record(record.name, record.type)
-        if record_to_update and record_to_update.id:
-            # if the record already exists
-            uri = (f"https://api.cloudflare.com/client/v4/"
-                   f"zones/{self.zone_id}/"
-                   f"dns_records/{record_to_update.id}")
-            payload = {"name": record.name, "type": record.type,
-                       "content": record.value, "ttl": record.ttl}
-            response = requests.patch(url=uri,
-                                      headers=self.headers,
-                                      json=payload,
-                                      timeout=self.timeout)
-        else:
-            # if the record does not exist
-            uri = (f"https://api.cloudflare.com/client/v4/"
-                   f"zones/{self.zone_id}/"
-                   f"dns_records")
-            payload = {"name": record.name, "type": record.type,
-                       "content": record.value, "ttl": record.ttl,
-                       "proxied": False}
-            response = requests.post(url=uri,
-                                     headers=self.headers,
-                                     json=payload,
-                                     timeout=self.timeout)
+    def set_record(self, record: DNSRecord) -> DNSRecord:
+        payload = {"name": record.name, "type": record.type,
+                   "content": record.value, "ttl": record.ttl}
+        if record.id:
+            # trust the known record id, only look it up again if it turns out stale
+            response = self.request("PATCH", f"zones/{self.zone_id}/dns_records/{record.id}",
+                                    json=payload)
+            if response.status_code == 404:
+                self.logger.warning(f"Record id {record.id} of {record.type} record for {record.name} is stale")
+                record = replace(record, id="")
+        if not record.id:
+            record_to_update = self.get_record(record.name, record.type)
+            if record_to_update and record_to_update.id:
+                # if the record already exists
+                response = self.request("PATCH", f"zones/{self.zone_id}/dns_records/{record_to_update.id}",
+                                        json=payload)
+            else:
+                # if the record does not exist
+                response = self.request("POST", f"zones/{self.zone_id}/dns_records",
+                                        json=payload | {"proxied": False})
         try:
-            if response.status_code == 200 and response.json()["success"]:
+            if response.status_code == 200 and response.body["success"]:
                 self.logger.info(f"Succeeded to set {record.type} record for {record.name} as {record.value}")
-                self.logger.debug(response.json())
-                return True
+                self.logger.debug(response.body)
+                return self.parse_record(response.body["result"])
             else:
                 self.logger.warning(f"Failed to set {record.type} record for {record.name} as {record.value}:\n"
                                     f"Status Code: {response.status_code}\n"
-                                    f"Json Content: {response.json()}")
-                return False
+                                    f"Json Content: {response.body}")
+                return None
         except Exception as e:
             self.logger.warning(f"Failed to set {record.type} record for {record.name} as {record.value}:\n"
                                 f"Status Code: {response.status_code}\n"
-                                f"Json Content: {response.json()}\n"
+                                f"Json Content: {response.body}\n"
                                 f"Exception: {e}")
-            return False
-        
-    def delete_record(self, name: str, type: RECORD_TYPE) -> bool:
-        record_to_delete = self.get_record(name, type)
-        if not record_to_delete or not record_to_delete.id:
-            self.logger.warning(f"Failed to delete {type} record for {name}: Not existed")
-            return False
-        
-        uri = (f"https://api.cloudflare.com/client/v4/"
-               f"zones/{self.zone_id}/"
-               f"dns_records/{record_to_delete.id}")
-        response = requests.delete(url=uri,
-                                   headers=self.headers,
-                                   timeout=self.timeout)
+            return None
+
+    def delete_record(self, name: str, type: RECORD_TYPE, id: str = "") -> bool:
+        if id:
+            # trust the known record id, only look it up again if it turns out stale
+            response = self.request("DELETE", f"zones/{self.zone_id}/dns_records/{id}")
+            if response.status_code == 404:
+                self.logger.warning(f"Record id {id} of {type} record for {name} is stale")
+                id = ""
+        if not id:
+            record_to_delete = self.get_record(name, type)
+            if not record_to_delete or not record_to_delete.id:
+                self.logger.warning(f"Failed to delete {type} record for {name}: Not existed")
+                return False
+            response = self.request("DELETE", f"zones/{self.zone_id}/dns_records/{record_to_delete.id}")
         try:
-            if response.status_code == 200 and response.json()["success"]:
+            if response.status_code == 200 and response.body["success"]:
                 self.logger.info(f"Succeeded to delete {type} record for {name}")
-                self.logger.debug(response.json())
+                self.logger.debug(response.body)
                 return True
             else:
                 self.logger.warning(f"Failed to delete {type} record for {name}:\n"
                                     f"Status Code: {response.status_code}\n"
-                                    f"Json Content: {response.json()}")
+                                    f"Json Content: {response.body}")
                 return False
         except Exception as e:
             self.logger.warning(f"Failed to delete {type} record for {name}:\n"
                                 f"Status Code: {response.status_code}\n"
-                                f"Json Content: {response.json()}\n"
+                                f"Json Content: {response.body}\n"
                                 f"Exception: {e}")
             return False
+
+    def apply_changes(self, changes: list[DNSRecordChange]) -> list:
+        if len(changes) < 2:
+            return super().apply_changes(changes)
+        results = []
+        for start in range(0, len(changes), self.BATCH_SIZE):
+            chunk = changes[start:start + self.BATCH_SIZE]
+            chunk_results = self.batch_records(chunk)
+            if (chunk_results is None and any(change.record.id for change in chunk)
+                    and self.refresh_records(force=True)):
+                # known ids might be stale, retry with fresh ids from the re-read zone
+                chunk_results = self.batch_records([replace(change, record=replace(change.record, id=""))
+                                                    for change in chunk])
+            if chunk_results is None:
+                # a batch is all or nothing, retry one by one so a single bad item
+                # (e.g. a stale id) can not block the others
+                self.logger.warning(f"Falling back to {len(chunk)} single record changes")
+                chunk_results = super().apply_changes(chunk)
+            results.extend(chunk_results)
+        return results
+
+    def batch_records(self, changes: list[DNSRecordChange]) -> list:
+        # records without a known id are looked up in the zone snapshot first,
+        # without one a post could duplicate an existing record, those go one by one instead
+        if any(not change.record.id for change in changes) and not self.refresh_records():
+            self.logger.warning(f"No zone snapshot to batch {len(changes)} record changes")
+            return None
+        results: list = [None] * len(changes)
+        payload: dict[str, list] = {"deletes": [], "patches": [], "posts": []}
+        slots: dict[str, list[int]] = {"deletes": [], "patches": [], "posts": []}
+        for index, change in enumerate(changes):
+            record = change.record
+            record_id = record.id
+            if not record_id:
+                cached_record = self.record_cache.get(record.name, record.type)
+                record_id = cached_record.id if cached_record else ""
+            if change.action == "delete":
+                if not record_id:
+                    self.logger.warning(f"Failed to delete {record.type} record for {record.name}: Not existed")
+                    results[index] = False
+                    continue
+                payload["deletes"].append({"id": record_id})
+                slots["deletes"].append(index)
+            elif record_id:
+                payload["patches"].append({"id": record_id,
+                                           "name": record.name, "type": record.type,
+                                           "content": record.value, "ttl": record.ttl})
+                slots["patches"].append(index)
+            else:
+                payload["posts"].append({"name": record.name, "type": record.type,
+                                         "content": record.value, "ttl": record.ttl,
+                                         "proxied": False})
+                slots["posts"].append(index)
+
+        if not any(payload.values()):
+            return results
+        response = self.request("POST", f"zones/{self.zone_id}/dns_records/batch",
+                                json=payload)
+        try:
+            if response.status_code == 200 and response.body["success"]:
+                self.logger.info(f"Succeeded to batch {len(payload['deletes'])} delete(s), "
+                                 f"{len(payload['patches'])} patch(es) and {len(payload['posts'])} post(s)")
+                self.logger.debug(response.body)
+                for index in slots["deletes"]:
+                    results[index] = True
+                for kind in ("patches", "posts"):
+                    for index, result in zip(slots[kind], response.body["result"][kind]):
+                        results[index] = self.parse_record(result)
+                return results
+            else:
+                self.logger.warning(f"Failed to batch {len(changes)} record changes:\n"
+                                    f"Status Code: {response.status_code}\n"
+                                    f"Json Content: {response.body}")
+                return None
+        except Exception as e:
+            self.logger.warning(f"Failed to batch {len(changes)} record changes:\n"
+                                f"Status Code: {response.status_code}\n"
+                                f"Json Content: {response.body}\n"
+                                f"Exception: {e}")
+            return None
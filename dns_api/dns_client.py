@@ -0,0 +1,210 @@
+from __future__ import annotations
+import time
+import random
+import select
+import socket
+import struct
+import pathlib
+import ipaddress
+import threading
+from dataclasses import dataclass, field
+
+
+@dataclass
+class DNSResponse:
+    rcode: int = 0
+    truncated: bool = False
+    authoritative: bool = False
+    # (owner name, type, value) of every answer record
+    answers: list[tuple[str, str, str]] = field(default_factory=list)
+
+    def values(self, name: str, type: str) -> list[str]:
+        return [value for owner, answer_type, value in self.answers
+                if owner == name.lower() and answer_type == type]
+
+
+class DNSClient:
+
+    TYPES: dict[str, int] = {"A": 1, "NS": 2, "CNAME": 5, "SOA": 6, "MX": 15, "TXT": 16, "AAAA": 28, "SRV": 33}
+    TYPE_NAMES: dict[int, str] = {code: name for name, code in TYPES.items()}
+    RCODE_NOERROR: int = 0
+    RCODE_FORMERR: int = 1
+    RCODE_NXDOMAIN: int = 3
+    # EDNS payload size that avoids IP fragmentation on common paths
+    EDNS_PAYLOAD: int = 1232
+    # how long discovered authoritative servers are trusted (seconds)
+    DISCOVERY_TTL: float = 3600
+    RESOLV_CONF = pathlib.Path("/etc/resolv.conf")
+
+    def __init__(self, timeout: float = 2, retries: int = 1) -> None:
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self.lock = threading.Lock()
+        self.discovered: dict[str, tuple[float, list[tuple[str, int]]]] = {}
+
+    @staticmethod
+    def parse_server(server: str, default_port: int = 53) -> tuple[str, int]:
+        # "192.0.2.1", "192.0.2.1:5353", "2001:db8::1" or "[2001:db8::1]:5353"
+        if server.startswith("["):
+            host, _, port = server[1:].partition("]")
+            return host, int(port.lstrip(":") or default_port)
+        if server.count(":") == 1:
+            host, port = server.split(":")
+            return host, int(port)
+        return server, default_port
+
+    def build_query(self, query_id: int, name: str, type: str,
+                    edns: bool = True, recursion: bool = False) -> bytes:
+        flags = 0x0100 if recursion else 0
+        header = struct.pack("!HHHHHH", query_id, flags, 1, 0, 0, 1 if edns else 0)
+        question = b"".join(bytes([len(label)]) + label.encode("idna")
+                            for label in name.rstrip(".").split(".") if label) + b"\x00"
+        question += struct.pack("!HH", self.TYPES[type], 1)
+        # OPT pseudo record: root name, type 41, payload size as class, no extended flags
+        opt = b"\x00" + struct.pack("!HHIH", 41, self.EDNS_PAYLOAD, 0, 0) if edns else b""
+        return header + question + opt
+
+    @staticmethod
+    def read_name(data: bytes, offset: int) -> tuple[str, int]:
+        # returns the name and the offset right after it, following compression pointers
+        labels = []
+        end = None
+        for _ in range(128):
+            length = data[offset]
+            if length & 0xC0 == 0xC0:
+                if end is None:
+                    end = offset + 2
+                offset = ((length & 0x3F) << 8) | data[offset + 1]
+            elif length == 0:
+                offset += 1
+                break
+            else:
+                labels.append(data[offset + 1:offset + 1 + length].decode("ascii", "replace"))
+                offset += 1 + length
+        else:
+            raise ValueError("DNS name compression loop")
+        return ".".join(labels).lower(), end if end is not None else offset
+
+    def parse_response(self, data: bytes) -> tuple[int, DNSResponse]:
+        query_id, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+        response = DNSResponse(rcode=flags & 0x000F,
+                               truncated=bool(flags & 0x0200),
+                               authoritative=bool(flags & 0x0400))
+        offset = 12
+        for _ in range(qdcount):
+            _, offset = self.read_name(data, offset)
+            offset += 4
+        for _ in range(ancount):
+            owner, offset = self.read_name(data, offset)
+            type_code, _, _, length = struct.unpack("!HHIH", data[offset:offset + 10])
+            offset += 10
+            rdata = data[offset:offset + length]
+            type = self.TYPE_NAMES.get(type_code)
+            if type == "A":
+                response.answers.append((owner, type, str(ipaddress.IPv4Address(rdata))))
+            elif type == "AAAA":
+                response.answers.append((owner, type, str(ipaddress.IPv6Address(rdata))))
+            elif type in ("NS", "CNAME"):
+                response.answers.append((owner, type, self.read_name(data, offset)[0]))
+            elif type == "TXT":
+                strings, position = [], 0
+                while position < length:
+                    strings.append(rdata[position + 1:position + 1 + rdata[position]].decode("utf-8", "replace"))
+                    position += 1 + rdata[position]
+                response.answers.append((owner, type, "".join(strings)))
+            offset += length
+        return query_id, response
+
+    def query_tcp(self, server: tuple[str, int], name: str, type: str,
+                  edns: bool = True, recursion: bool = False) -> DNSResponse:
+        query_id = random.getrandbits(16)
+        query = self.build_query(query_id, name, type, edns, recursion)
+        with socket.create_connection(server, timeout=self.timeout) as connection:
+            connection.sendall(struct.pack("!H", len(query)) + query)
+            data = b""
+            while len(data) < 2 or len(data) < 2 + struct.unpack("!H", data[:2])[0]:
+                chunk = connection.recv(65535)
+                if not chunk:
+                    raise ConnectionError("DNS connection closed early")
+                data += chunk
+        _, response = self.parse_response(data[2:])
+        return response
+
+    def query_many(self, server: tuple[str, int], questions: list[tuple[str, str]],
+                   recursion: bool = False) -> list[DNSResponse]:
+        # every question goes out at once over one UDP socket, answers are matched by id,
+        # truncated answers are asked again over TCP, None for questions left unanswered
+        responses: list[DNSResponse] = [None] * len(questions)
+        if not questions:
+            return responses
+        family = socket.AF_INET6 if ":" in server[0] else socket.AF_INET
+        ids = random.sample(range(65536), len(questions))
+        pending: dict[int, int] = {query_id: index for index, query_id in enumerate(ids)}
+        retry_tcp: list[tuple[int, bool]] = []
+        with socket.socket(family, socket.SOCK_DGRAM) as udp_socket:
+            udp_socket.connect(server)
+            for attempt in range(self.retries + 1):
+                for query_id, index in pending.items():
+                    name, type = questions[index]
+                    udp_socket.send(self.build_query(query_id, name, type, recursion=recursion))
+                deadline = time.monotonic() + self.timeout
+                while pending:
+                    wait = deadline - time.monotonic()
+                    if wait <= 0 or not select.select([udp_socket], [], [], wait)[0]:
+                        break
+                    try:
+                        query_id, response = self.parse_response(udp_socket.recv(65535))
+                    except (OSError, ValueError, struct.error, IndexError):
+                        continue
+                    if query_id not in pending:
+                        continue
+                    index = pending.pop(query_id)
+                    if response.truncated:
+                        retry_tcp.append((index, True))
+                    elif response.rcode == self.RCODE_FORMERR:
+                        # an old server not speaking EDNS
+                        retry_tcp.append((index, False))
+                    else:
+                        responses[index] = response
+                if not pending:
+                    break
+        for index, edns in retry_tcp:
+            name, type = questions[index]
+            try:
+                responses[index] = self.query_tcp(server, name, type, edns=edns, recursion=recursion)
+            except (OSError, ValueError, struct.error, IndexError):
+                pass
+        return responses
+
+    def system_resolvers(self) -> list[tuple[str, int]]:
+        try:
+            lines = self.RESOLV_CONF.read_text().splitlines()
+        except OSError:
+            return []
+        return [self.parse_server(line.split()[1]) for line in lines
+                if line.startswith("nameserver") and len(line.split()) > 1]
+
+    def authoritative_servers(self, domain: str) -> list[tuple[str, int]]:
+        # NS of the zone through the system resolver, then their addresses
+        with self.lock:
+            cached = self.discovered.get(domain)
+            if cached and time.monotonic() < cached[0]:
+                return cached[1]
+        names: list[str] = []
+        for resolver in self.system_resolvers():
+            response = self.query_many(resolver, [(domain, "NS")], recursion=True)[0]
+            if response and response.rcode == self.RCODE_NOERROR:
+                names = response.values(domain, "NS")
+                break
+        servers: list[tuple[str, int]] = []
+        for name in names:
+            try:
+                for *_, address in socket.getaddrinfo(name, 53, type=socket.SOCK_DGRAM):
+                    if (address[0], 53) not in servers:
+                        servers.append((address[0], 53))
+            except OSError:
+                continue
+        if servers:
+            with self.lock:
+                self.discovered[domain] = (time.monotonic() + self.DISCOVERY_TTL, servers)
+        return servers
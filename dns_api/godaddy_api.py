@@ -1,7 +1,6 @@
-import requests
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from logger import TaskLogger
-from .utils import RECORD_TYPE, DNSRecord
+from .utils import RECORD_TYPE, DNSRecord, DNSRecordChange
 from .abstract_api import AbstractDNSConfig, AbstractDNSApi
 
 
@@ -11,31 +10,70 @@ class GodaddyDNSConfig(AbstractDNSConfig):
     use_proxy: bool = True
     key: str = ""
     secret: str = ""
+    # write all changed records of one type with a single request
+    bulk_update: bool = True
 
 
 class GodaddyDNSApi(AbstractDNSApi):
-    
+
+    API_BASE: str = "https://api.godaddy.com/v1"
+    # 60 requests per minute per API key
+    RATE_LIMIT: tuple[float, int] = (1, 60)
+    RECORD_IDS: bool = False
+    PAGE_SIZE: int = 500
+    # record types that carry nothing but name / data / ttl, safe to be replaced in bulk
+    BULK_TYPES: tuple[str, ...] = ("A", "AAAA", "CNAME", "TXT")
+
     def __init__(self, config: GodaddyDNSConfig, task_logger: TaskLogger):
         super().__init__(config, task_logger)
         self.key: str = config.key
         self.secret: str = config.secret
+        self.bulk_update: bool = config.bulk_update
         self.headers: dict = {"Accept": "application/json",
                               "Content-Type": "application/json",
                               "Authorization": f"sso-key {self.key}:{self.secret}"}
+        self.setup_rate_limiter(credential=self.key)
+
+    def list_all_records(self) -> list[DNSRecord]:
+        records: list[DNSRecord] = []
+        offset = 0
+        while True:
+            response = self.request("GET", f"domains/{self.domain}/records",
+                                    params={"offset": offset, "limit": self.PAGE_SIZE})
+            try:
+                if response.status_code == 200:
+                    self.logger.debug(response.body)
+                    for result in response.body:
+                        records.append(DNSRecord(domain=self.domain,
+                                                 name=result["name"],
+                                                 type=result["type"],
+                                                 value=result["data"],
+                                                 ttl=result["ttl"]))
+                    if len(response.body) < self.PAGE_SIZE:
+                        break
+                    offset += self.PAGE_SIZE
+                else:
+                    self.logger.warning(f"Failed to list records (offset {offset}):\n"
+                                        f"Status Code: {response.status_code}\n"
+                                        f"Json Content: {response.body}")
+                    return None
+            except Exception as e:
+                self.logger.warning(f"Failed to list records (offset {offset}):\n"
+                                    f"Status Code: {response.status_code}\n"
+                                    f"Json Content: {response.body}\n"
+                                    f"Exception: {e}")
+                return None
+        self.logger.info(f"Succeeded to list {len(records)} records")
+        return records
 
     def get_record(self, name: str, type: RECORD_TYPE) -> DNSRecord:
-        uri = (f"https://api.godaddy.com/v1/domains/{self.domain}/"
-               f"records/{type}/{name}")
-        response = requests.get(url=uri,
-                                headers=self.headers,
-                                timeout=self.timeout)
+        response = self.request("GET", f"domains/{self.domain}/records/{type}/{name}")
         try:
             if response.status_code == 200:
                 self.logger.info(f"Succeeded to get {type} record for {name}")
-                response_json = response.json()
-                self.logger.debug(response_json)
-                if len(response_json) > 0:
-                    result = response_json[0]
+                self.logger.debug(response.body)
+                if len(response.body) > 0:
+                    result = response.body[0]
                     return DNSRecord(domain=self.domain, name=name, type=type,
                                      value=result["data"],
                                      ttl=result["ttl"])
@@ -45,45 +83,39 @@ class GodaddyDNSApi(AbstractDNSApi):
             else:
                 self.logger.warning(f"Failed to fetch {type} record for {name}:\n"
                                     f"Status Code: {response.status_code}\n"
-                                    f"Json Content: {response.json()}")
-                return None
+                                    f"Json Content: {response.body}")
         except Exception as e:
             self.logger.warning(f"Failed to fetch {type} record for {name}:\n"
                                 f"Status Code: {response.status_code}\n"
-                                f"Json Content: {response.json()}\n"
+                                f"Json Content: {response.body}\n"
                                 f"Exception: {e}")
-            return None
+        # None is kept for a record confirmed missing
+        raise LookupError(f"Failed to fetch {type} record for {name}")
 
-    def set_record(self, record: DNSRecord) -> bool:
-        uri = (f"https://api.godaddy.com/v1/domains/{self.domain}/"
-               f"records/{record.type}/{record.name}")
+    def set_record(self, record: DNSRecord) -> DNSRecord:
         payload = [{"data": record.value, "ttl": record.ttl}]
-        response = requests.put(url=uri,
-                                headers=self.headers,
-                                json=payload,
-                                timeout=self.timeout)
+        response = self.request("PUT", f"domains/{self.domain}/records/{record.type}/{record.name}",
+                                json=payload)
         try:
             if response.status_code == 200:
-                return True
+                self.logger.info(f"Succeeded to set {record.type} record for {record.name} as {record.value}")
+                # Godaddy replies with an empty body, what we sent is what is stored now
+                return replace(record, domain=self.domain, id="")
             else:
                 self.logger.warning(f"Failed to set {record.type} record for {record.name} as {record.value}:\n"
                                     f"Status Code: {response.status_code}\n"
-                                    f"Json Content: {response.json()}")
-                return False
+                                    f"Json Content: {response.body}")
+                return None
         except Exception as e:
             self.logger.warning(f"Failed to set {record.type} record for {record.name} as {record.value}:\n"
                                 f"Status Code: {response.status_code}\n"
-                                f"Json Content: {response.json()}\n"
+                                f"Json Content: {response.body}\n"
                                 f"Exception: {e}")
-            return False
-        
-    def delete_record(self, name: str, type: RECORD_TYPE) -> bool:
-        uri = (f"https://api.godaddy.com/v1/"
-               f"domains/{self.domain}/"
-               f"records/{type}/{name}")
-        response = requests.delete(url=uri,
-                                   headers=self.headers,
-                                   timeout=self.timeout)
+            return None
+
+    def delete_record(self, name: str, type: RECORD_TYPE, id: str = "") -> bool:
+        # Godaddy records have no id, they are addressed by type and name
+        response = self.request("DELETE", f"domains/{self.domain}/records/{type}/{name}")
         try:
             if response.status_code == 204:
                 self.logger.info(f"Succeeded to delete {type} record for {name}")
@@ -91,11 +123,71 @@ class GodaddyDNSApi(AbstractDNSApi):
             else:
                 self.logger.warning(f"Failed to delete {type} record for {name}:\n"
                                     f"Status Code: {response.status_code}\n"
-                                    f"Json Content: {response.json()}")
+                                    f"Json Content: {response.body}")
                 return False
         except Exception as e:
             self.logger.warning(f"Failed to delete {type} record for {name}:\n"
                                 f"Status Code: {response.status_code}\n"
-                                f"Json Content: {response.json()}\n"
+                                f"Json Content: {response.body}\n"
                                 f"Exception: {e}")
             return False
+
+    def apply_changes(self, changes: list[DNSRecordChange]) -> list:
+        if not self.bulk_update:
+            return super().apply_changes(changes)
+        results: list = [None] * len(changes)
+        groups: dict[str, list[int]] = {}
+        singles: list[int] = []
+        for index, change in enumerate(changes):
+            if change.action == "set" and change.record.type in self.BULK_TYPES:
+                groups.setdefault(change.record.type, []).append(index)
+            else:
+                singles.append(index)
+        for type, indexes in list(groups.items()):
+            if len(indexes) < 2:
+                # nothing to gain from a bulk write
+                singles.extend(groups.pop(type))
+
+        # the whole record set of a type is replaced, so it is built from a fresh snapshot of the zone,
+        # without one only single records are written
+        if groups and not self.refresh_records(force=True):
+            singles.extend(index for indexes in groups.values() for index in indexes)
+            groups = {}
+        for type, indexes in groups.items():
+            type_results = self.replace_type_records(type, [changes[index].record for index in indexes])
+            if type_results is None:
+                singles.extend(indexes)
+                continue
+            for index, result in zip(indexes, type_results):
+                results[index] = result
+
+        single_results = super().apply_changes([changes[index] for index in singles])
+        for index, result in zip(singles, single_results):
+            results[index] = result
+        return results
+
+    def replace_type_records(self, type: RECORD_TYPE, records: list[DNSRecord]) -> list[DNSRecord]:
+        # every record of the type that is not changed goes along, managed or not
+        changed_names = {record.name for record in records}
+        kept_records = [record for record in self.record_cache.records_of_type(type)
+                        if record.name not in changed_names]
+        payload = [{"name": record.name, "data": record.value, "ttl": record.ttl}
+                   for record in kept_records + records]
+        response = self.request("PUT", f"domains/{self.domain}/records/{type}",
+                                json=payload)
+        try:
+            if response.status_code == 200:
+                self.logger.info(f"Succeeded to set {len(records)} {type} record(s) in bulk "
+                                 f"({len(kept_records)} other record(s) kept)")
+                return [replace(record, domain=self.domain, id="") for record in records]
+            else:
+                self.logger.warning(f"Failed to set {len(records)} {type} record(s) in bulk:\n"
+                                    f"Status Code: {response.status_code}\n"
+                                    f"Json Content: {response.body}")
+                return None
+        except Exception as e:
+            self.logger.warning(f"Failed to set {len(records)} {type} record(s) in bulk:\n"
+                                f"Status Code: {response.status_code}\n"
+                                f"Json Content: {response.body}\n"
+                                f"Exception: {e}")
+            return None
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import re
+import time
+import threading
+from collections import deque
+from typing import Literal
+from email.utils import parsedate_to_datetime
+
+
+PRIORITY = Literal["high", "low"]
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+class RateLimiter:
+
+    # limiters are shared by every handler using the same provider credential
+    _shared: dict[tuple, RateLimiter] = {}
+    _shared_lock = threading.Lock()
+
+    # window (seconds) used to report budget utilization
+    WINDOW: float = 60
+    # used when a 429 comes without any hint of how long to wait
+    DEFAULT_RETRY_AFTER: float = 60
+
+    def __init__(self, rate: float, burst: int, reserve: float = 0.2) -> None:
+        self.rate: float = rate
+        self.burst: int = burst
+        # share of the bucket only writes may use, reads wait until there is more
+        self.reserve: float = burst * reserve
+        self.tokens: float = burst
+        self.updated_at: float = time.monotonic()
+        self.blocked_until: float = 0
+        self.history: deque[float] = deque()
+        self.condition = threading.Condition()
+
+    @classmethod
+    def shared(cls, key: tuple, rate: float, burst: int, reserve: float = 0.2) -> RateLimiter:
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(rate, burst, reserve)
+            return cls._shared[key]
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, priority: PRIORITY = "high", timeout: float = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        floor = self.reserve if priority == "low" else 0
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                if now >= self.blocked_until and self.tokens - 1 >= floor:
+                    self.tokens -= 1
+                    self.history.append(now)
+                    return True
+                wait = max(self.blocked_until - now, (floor + 1 - self.tokens) / self.rate)
+                if deadline is not None:
+                    if now + wait > deadline:
+                        return False
+                self.condition.wait(wait)
+
+    def block(self, seconds: float):
+        with self.condition:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+    def update(self, status_code: int, headers: dict, body=None):
+        # learn from what the provider tells about the budget
+        remaining = self.parse_remaining(headers)
+        if remaining is not None:
+            with self.condition:
+                self.tokens = min(self.tokens, remaining)
+        if status_code == 429:
+            retry_after = self.parse_retry_after(headers, body)
+            self.block(self.DEFAULT_RETRY_AFTER if retry_after is None else retry_after)
+
+    @staticmethod
+    def parse_retry_after(headers: dict, body=None) -> float:
+        value = {key.lower(): value for key, value in headers.items()}.get("retry-after")
+        if value:
+            try:
+                return max(0, float(value))
+            except ValueError:
+                try:
+                    return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        # Godaddy puts it into the body
+        if isinstance(body, dict) and "retryAfterSec" in body:
+            return float(body["retryAfterSec"])
+        return None
+
+    @staticmethod
+    def parse_remaining(headers: dict) -> float:
+        headers = {key.lower(): value for key, value in headers.items()}
+        for name in ("x-ratelimit-remaining", "ratelimit-remaining"):
+            if name in headers:
+                try:
+                    return float(headers[name])
+                except ValueError:
+                    pass
+        # structured form, e.g. ratelimit: "default";r=1199;t=300
+        match = re.search(r";\s*r=(\d+)", headers.get("ratelimit", ""))
+        if match:
+            return float(match.group(1))
+        return None
+
+    def utilization(self) -> float:
+        # share of the sustainable budget used over the last window
+        with self.condition:
+            now = time.monotonic()
+            while self.history and self.history[0] < now - self.WINDOW:
+                self.history.popleft()
+            return len(self.history) / (self.rate * self.WINDOW)
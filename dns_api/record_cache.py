@@ -0,0 +1,72 @@
+import time
+import threading
+from dataclasses import replace
+from .utils import RECORD_TYPE, DNSRecord, DNSRecordQueryKey
+
+
+class RecordCache:
+
+    def __init__(self, ttl: float = 300) -> None:
+        self.ttl: float = ttl
+        self.lock = threading.Lock()
+        self.records: list[DNSRecord] = []
+        self.by_key: dict[DNSRecordQueryKey, DNSRecord] = {}
+        self.by_id: dict[str, DNSRecord] = {}
+        self.updated_at: float = 0
+
+    @property
+    def is_fresh(self) -> bool:
+        return bool(self.updated_at) and time.monotonic() - self.updated_at < self.ttl
+
+    def load(self, records: list[DNSRecord]):
+        # replace the whole snapshot, only the first record of each (name, type) is indexed,
+        # same as what get_record would return
+        with self.lock:
+            self.records = list(records)
+            self.by_key = {}
+            self.by_id = {}
+            for record in self.records:
+                self.by_key.setdefault(DNSRecordQueryKey(name=record.name, type=record.type), record)
+                if record.id:
+                    self.by_id[record.id] = record
+            self.updated_at = time.monotonic()
+
+    def invalidate(self):
+        with self.lock:
+            self.updated_at = 0
+
+    def get(self, name: str, type: RECORD_TYPE) -> DNSRecord:
+        with self.lock:
+            record = self.by_key.get(DNSRecordQueryKey(name=name, type=type))
+        return replace(record) if record else None
+
+    def get_by_id(self, id: str) -> DNSRecord:
+        with self.lock:
+            record = self.by_id.get(id)
+        return replace(record) if record else None
+
+    def records_of_type(self, type: RECORD_TYPE) -> list[DNSRecord]:
+        with self.lock:
+            return [replace(record) for record in self.records if record.type == type]
+
+    def put(self, record: DNSRecord):
+        # write-through after a successful change, keeps the snapshot age untouched
+        key = DNSRecordQueryKey(name=record.name, type=record.type)
+        with self.lock:
+            old_record = self.by_key.get(key)
+            if old_record is not None:
+                self.records.remove(old_record)
+                self.by_id.pop(old_record.id, None)
+            record = replace(record)
+            self.records.append(record)
+            self.by_key[key] = record
+            if record.id:
+                self.by_id[record.id] = record
+
+    def discard(self, name: str, type: RECORD_TYPE):
+        key = DNSRecordQueryKey(name=name, type=type)
+        with self.lock:
+            old_record = self.by_key.pop(key, None)
+            if old_record is not None:
+                self.records.remove(old_record)
+                self.by_id.pop(old_record.id, None)
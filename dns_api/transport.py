@@ -0,0 +1,92 @@
+from __future__ import annotations
+import threading
+from typing import Any
+from dataclasses import dataclass, field
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# what counts towards a provider's circuit breaker
+TIMEOUT_ERRORS: tuple[type[Exception], ...] = (TimeoutError, requests.exceptions.Timeout)
+
+
+@dataclass
+class ApiResponse:
+    status_code: int = 0
+    body: Any = None
+    headers: dict = field(default_factory=dict)
+    # bytes of the body, and retries done by the transport (5xx, connection errors) before this response
+    size: int = 0
+    retries: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status_code < 300
+
+    @classmethod
+    def from_response(cls, response: requests.Response) -> ApiResponse:
+        # parse the body exactly once, non-json bodies are kept as plain text
+        body = None
+        if response.content:
+            try:
+                body = response.json()
+            except ValueError:
+                body = response.text
+        retry = getattr(response.raw, "retries", None)
+        return cls(status_code=response.status_code,
+                   body=body,
+                   headers=dict(response.headers),
+                   size=len(response.content),
+                   retries=len(retry.history) if retry else 0)
+
+
+class HttpTransport:
+
+    # transports are shared by every handler talking to the same endpoint
+    # with the same settings, so keep-alive connections are reused across tasks
+    _shared: dict[tuple, HttpTransport] = {}
+    _shared_lock = threading.Lock()
+
+    RETRY_STATUS: tuple[int, ...] = (500, 502, 503, 504)
+
+    def __init__(self, base_url: str, pool_size: int = 4,
+                 max_retries: int = 2, retry_backoff: float = 0.5, proxy: str = "") -> None:
+        self.base_url: str = base_url.rstrip("/")
+        retry = Retry(total=max_retries,
+                      backoff_factor=retry_backoff,
+                      status_forcelist=self.RETRY_STATUS,
+                      respect_retry_after_header=True,
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=pool_size,
+                              max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount(self.base_url + "/", adapter)
+        if proxy:
+            # only this transport goes through the proxy, the adapter pools the proxied connections
+            self.session.proxies = {"http": proxy, "https": proxy}
+            # the configured proxy wins over HTTP(S)_PROXY / NO_PROXY / .netrc from the environment
+            self.session.trust_env = False
+
+    @classmethod
+    def shared(cls, base_url: str, pool_size: int = 4,
+               max_retries: int = 2, retry_backoff: float = 0.5, proxy: str = "") -> HttpTransport:
+        key = (base_url.rstrip("/"), pool_size, max_retries, retry_backoff, proxy)
+        with cls._shared_lock:
+            if key not in cls._shared:
+                cls._shared[key] = cls(*key)
+            return cls._shared[key]
+
+    def request(self, method: str, path: str, headers: dict = None,
+                timeout: float = 10, **kwargs) -> ApiResponse:
+        response = self.session.request(method=method,
+                                        url=self.base_url + "/" + path.lstrip("/"),
+                                        headers=headers,
+                                        timeout=timeout,
+                                        **kwargs)
+        return ApiResponse.from_response(response)
+
+    def close(self):
+        self.session.close()
@@ -1,2 +1,21 @@
-from .localhost import Localhost
-from .asus_router import AsusRouter
+from .observer import IPObserver, SourceReading
+
+
+# source handlers pull in netifaces / paramiko, they are only imported when asked for
+def __getattr__(name: str):
+    if name == "Localhost":
+        from .localhost import Localhost
+        return Localhost
+    if name == "AsusRouter":
+        from .asus_router import AsusRouter
+        return AsusRouter
+    if name == "IPEcho":
+        from .ip_echo import IPEcho
+        return IPEcho
+    if name == "UPnPGateway":
+        from .upnp_gateway import UPnPGateway
+        return UPnPGateway
+    if name == "NATPMPGateway":
+        from .natpmp_gateway import NATPMPGateway
+        return NATPMPGateway
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
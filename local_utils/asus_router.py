@@ -1,47 +1,97 @@
 import ipaddress
+import threading
 import paramiko
 from logger import TaskLogger
+from tracing import tracer
 
 
 class AsusRouter:
 
-    def __init__(self, task_logger: TaskLogger, username: str, password: str = "", timeout: float = 5) -> None:
+    # seconds between SSH keepalive packets on the long-lived session
+    KEEPALIVE_INTERVAL: int = 30
+
+    def __init__(self, task_logger: TaskLogger, username: str, password: str = "", timeout: float = 5,
+                 hostname: str = "router.asus.com", port: int = 22) -> None:
         self.logger = task_logger.getChild("Local")
-        self.hostname: str = "router.asus.com"
-        self.port: int = 22
+        self.hostname: str = hostname
+        self.port: int = port
         self.username: str = username
         self.password: str = password
         self.timeout: float = timeout
-     
+        # one session is kept open and shared, commands on it are serialized
+        self.ssh: paramiko.SSHClient = None
+        self.lock = threading.Lock()
+
+    def is_connected(self) -> bool:
+        if self.ssh is None:
+            return False
+        transport = self.ssh.get_transport()
+        return transport is not None and transport.is_active()
+
+    def connect(self) -> paramiko.SSHClient:
+        # reuse the session while it is healthy, reconnect lazily otherwise
+        if self.is_connected():
+            return self.ssh
+        self.close()
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy)
+        with tracer.span("ssh.connect", host=f"{self.hostname}:{self.port}"):
+            ssh.connect(hostname=self.hostname, port=self.port,
+                        username=self.username, password=self.password,
+                        timeout=self.timeout, auth_timeout=self.timeout, banner_timeout=self.timeout)
+        ssh.get_transport().set_keepalive(self.KEEPALIVE_INTERVAL)
+        self.logger.info(f"SSH session to {self.hostname}:{self.port} established")
+        self.ssh = ssh
+        return ssh
+
+    def close(self):
+        if self.ssh is not None:
+            self.ssh.close()
+            self.ssh = None
+
+    def get_nvram(self, *keys: str) -> dict[str, str]:
+        # every key is read by one command, so it is a single round trip on the session
+        # an unset key prints nothing at all, so each value is echoed behind its key
+        command = "; ".join(f"echo \"{key}=$(nvram get {key})\"" for key in keys)
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    ssh = self.connect()
+                    with tracer.span("ssh.exec", host=f"{self.hostname}:{self.port}", keys=len(keys), retries=attempt):
+                        _, _stdout, _stderr = ssh.exec_command(command, timeout=self.timeout)
+                        lines = _stdout.read().decode().splitlines()
+                    break
+                except paramiko.AuthenticationException:
+                    self.close()
+                    raise
+                except Exception as e:
+                    # the session might have gone stale (e.g. router rebooted), retry once on a new one
+                    self.close()
+                    if not attempt:
+                        continue
+                    if isinstance(e, (OSError, paramiko.SSHException)):
+                        # unreachable or silent, the source's breaker counts it like a timeout
+                        raise TimeoutError(f"No answer from router {self.hostname}:{self.port}: {e}") from e
+                    raise
+        values = dict.fromkeys(keys, "")
+        for line in lines:
+            key, separator, value = line.partition("=")
+            if separator and key in values:
+                values[key] = value.strip()
+        return values
+
+    def get_wan_info(self) -> tuple[ipaddress.IPv4Address, ipaddress.IPv4Address]:
+        # For Asus routers with SSH enabled, returns (WAN IP, real IP)
+        # raises when the router can not be read (SSH errors and timeouts included), so the records are left alone
+        nvram = self.get_nvram("wan0_ipaddr", "wan0_realip_ip")
+        wan_ip = ipaddress.IPv4Address(nvram["wan0_ipaddr"] or "0.0.0.0")
+        if wan_ip.is_unspecified:
+            # the router reports no address while its WAN link is down
+            raise ValueError("Router has no WAN address")
+        return wan_ip, ipaddress.IPv4Address(nvram["wan0_realip_ip"] or "0.0.0.0")
+
     def get_wan_ip(self) -> ipaddress.IPv4Address:
-            # For Asus routers with SSH enabled
-            wan_ip = real_ip = "0.0.0.0"
-            try:
-                with paramiko.SSHClient() as ssh:
-                    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy)
-                    ssh.connect(hostname=self.hostname, port=self.port,
-                                username=self.username, password=self.password,
-                                timeout=self.timeout, auth_timeout=self.timeout, banner_timeout=self.timeout)
-                    _, _stdout, _stderr = ssh.exec_command("nvram get wan0_ipaddr")
-                    wan_ip =  _stdout.read().decode().strip() or wan_ip
-            except Exception as e:
-                self.logger.warning(f"Unable to get WAN IP from router:\n"
-                                    f"{e}")
-            return ipaddress.IPv4Address(wan_ip)
-    
+        return self.get_wan_info()[0]
+
     def get_real_ip(self) -> ipaddress.IPv4Address:
-            # For Asus routers with SSH enabled
-            wan_ip = real_ip = "0.0.0.0"
-            try:
-                with paramiko.SSHClient() as ssh:
-                    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy)
-                    ssh.connect(hostname=self.hostname, port=self.port,
-                                username=self.username, password=self.password,
-                                timeout=self.timeout, auth_timeout=self.timeout, banner_timeout=self.timeout)
-                    _, _stdout, _stderr = ssh.exec_command("nvram get wan0_realip_ip")
-                    real_ip =  _stdout.read().decode().strip() or real_ip
-            except Exception as e:
-                self.logger.warning(f"Unable to get WAN IP from router:\n"
-                                    f"{e}")
-            return ipaddress.IPv4Address(real_ip)
-    
\ No newline at end of file
+        return self.get_wan_info()[1]
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import time
+import ipaddress
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logger import TaskLogger
+from metrics import ip_echo_seconds
+
+
+@dataclass
+class EndpointStats:
+    # exponentially weighted latency of successful answers (seconds)
+    latency: float = 0
+    failures: int = 0
+    demoted_until: float = 0
+
+
+class IPEcho:
+
+    # plain text services answering with the caller's public address
+    ENDPOINTS_V4: tuple[str, ...] = ("https://api.ipify.org",
+                                     "https://ipv4.icanhazip.com",
+                                     "https://checkip.amazonaws.com",
+                                     "https://ipv4.seeip.org")
+    ENDPOINTS_V6: tuple[str, ...] = ("https://api6.ipify.org",
+                                     "https://ipv6.icanhazip.com",
+                                     "https://ipv6.seeip.org")
+    # endpoints asked at once, the healthiest ones first
+    RACE_WIDTH: int = 3
+    LATENCY_WEIGHT: float = 0.3
+    # consecutive failures before an endpoint is left out for a while
+    MAX_FAILURES: int = 3
+    # answers this many times slower than the best endpoint (and above SLOW_LATENCY) demote it too
+    SLOW_FACTOR: float = 4
+    SLOW_LATENCY: float = 1
+    DEMOTE_TIME: float = 300
+    DEMOTE_TIME_MAX: float = 3600
+
+    def __init__(self, task_logger: TaskLogger, timeout: float = 5, quorum: int = 1) -> None:
+        self.logger = task_logger.getChild("Local")
+        self.timeout: float = timeout
+        self.endpoints: dict[int, list[str]] = {4: list(self.ENDPOINTS_V4), 6: list(self.ENDPOINTS_V6)}
+        # agreeing answers needed, 1 takes the first one
+        self.quorum: int = quorum
+        self.stats: dict[str, EndpointStats] = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        # a proxy set for the DNS APIs would report its own address
+        self.session.trust_env = False
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=self.RACE_WIDTH))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.RACE_WIDTH))
+        # lookups that lost the race keep running here, their latency still counts
+        self.executor = ThreadPoolExecutor(max_workers=2 * self.RACE_WIDTH, thread_name_prefix="ip-echo")
+
+    def configure(self, endpoints_v4: list[str] = None, endpoints_v6: list[str] = None, quorum: int = None):
+        if endpoints_v4:
+            self.endpoints[4] = list(endpoints_v4)
+        if endpoints_v6:
+            self.endpoints[6] = list(endpoints_v6)
+        if quorum:
+            self.quorum = quorum
+
+    def ranked_endpoints(self, version: int) -> list[str]:
+        # healthy endpoints by latency, then the demoted ones by the end of their demotion
+        now = time.monotonic()
+        with self.lock:
+            stats = {endpoint: self.stats.setdefault(endpoint, EndpointStats()) for endpoint in self.endpoints[version]}
+        healthy = [endpoint for endpoint in stats if stats[endpoint].demoted_until <= now]
+        demoted = [endpoint for endpoint in stats if stats[endpoint].demoted_until > now]
+        # unknown endpoints (no latency yet) are tried early to learn about them
+        healthy.sort(key=lambda endpoint: stats[endpoint].latency)
+        demoted.sort(key=lambda endpoint: stats[endpoint].demoted_until)
+        return healthy + demoted
+
+    def query(self, endpoint: str, version: int) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+        start = time.monotonic()
+        try:
+            response = self.session.get(endpoint, timeout=self.timeout)
+            response.raise_for_status()
+            address = ipaddress.ip_address(response.text.strip())
+            if address.version != version:
+                raise ValueError(f"IPv{address.version} address {address} from an IPv{version} endpoint")
+        except Exception as e:
+            self.record_failure(endpoint, e)
+            raise
+        self.record_success(endpoint, time.monotonic() - start)
+        return address
+
+    def record_success(self, endpoint: str, latency: float):
+        ip_echo_seconds.observe(latency, endpoint=endpoint)
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.latency = latency if not stats.latency else (
+                self.LATENCY_WEIGHT * latency + (1 - self.LATENCY_WEIGHT) * stats.latency)
+            stats.failures = 0
+            best = min(other.latency for other in self.stats.values() if other.latency)
+            slow = (stats.latency > self.SLOW_LATENCY and stats.latency > self.SLOW_FACTOR * best
+                    and stats.demoted_until <= time.monotonic())
+            if slow:
+                stats.demoted_until = time.monotonic() + self.DEMOTE_TIME
+        if slow:
+            self.logger.warning(f"IP echo endpoint {endpoint} is slow ({stats.latency:.2f}s), demoted")
+
+    def record_failure(self, endpoint: str, error: Exception):
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.failures += 1
+            demote = stats.failures >= self.MAX_FAILURES
+            if demote:
+                demote_time = min(self.DEMOTE_TIME * 2 ** (stats.failures - self.MAX_FAILURES), self.DEMOTE_TIME_MAX)
+                stats.demoted_until = time.monotonic() + demote_time
+        self.logger.info(f"IP echo endpoint {endpoint} failed: {error}")
+        if demote:
+            self.logger.warning(f"IP echo endpoint {endpoint} failed {stats.failures} times in a row, "
+                                f"demoted for {demote_time:.0f}s")
+
+    def get_ip(self, version: int) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+        # asks several endpoints at once, returns as soon as enough of them agree,
+        # more endpoints are asked only when the first ones fail or disagree
+        endpoints = self.ranked_endpoints(version)
+        quorum = min(self.quorum, len(endpoints))
+        width = max(self.RACE_WIDTH, quorum + 1)
+        pending: set[Future] = {self.executor.submit(self.query, endpoint, version) for endpoint in endpoints[:width]}
+        waiting = endpoints[width:]
+        answers: Counter = Counter()
+        deadline = time.monotonic() + self.timeout
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    answers[future.result()] += 1
+                elif waiting:
+                    pending.add(self.executor.submit(self.query, waiting.pop(0), version))
+            if answers:
+                address, count = answers.most_common(1)[0]
+                if count >= quorum:
+                    return address
+            if not pending and waiting:
+                pending.add(self.executor.submit(self.query, waiting.pop(0), version))
+        raise LookupError(f"No {quorum} IP echo endpoint(s) agreed on an IPv{version} address "
+                          f"(answers: {dict(answers) or 'none'})")
+
+    def get_ipv4_ip(self) -> ipaddress.IPv4Address:
+        try:
+            return self.get_ip(version=4)
+        except Exception as e:
+            self.logger.warning(f"Unable to get IPv4 IP from IP echo services:\n"
+                                f"{e}")
+            return ipaddress.IPv4Address("127.0.0.1")
+
+    def get_ipv6_ip(self) -> ipaddress.IPv6Address:
+        try:
+            return self.get_ip(version=6)
+        except Exception as e:
+            self.logger.warning(f"Unable to get IPv6 IP from IP echo services:\n"
+                                f"{e}")
+            return ipaddress.IPv6Address("::1")
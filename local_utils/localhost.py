@@ -9,15 +9,19 @@ class Localhost:
     def __init__(self, task_logger: TaskLogger) -> None:
         self.logger = task_logger.getChild("Local")
 
-    def get_ipv4_ip(self) -> ipaddress.IPv4Address:
+    def find_interface(self, interface: str = "") -> str:
+        if interface:
+            return interface
         # just find the first wired network interface
         wired_iface_regex = re.compile(r"en[op][0-9]s[0-9]", flags=re.IGNORECASE)
-        interface: str = ""
         for interface_iter in netifaces.interfaces():
             if wired_iface_regex.match(str(interface_iter)):
                 interface = str(interface_iter)
                 break
-        addrs = netifaces.ifaddresses(interface)
+        return interface
+
+    def get_ipv4_ip(self, interface: str = "") -> ipaddress.IPv4Address:
+        addrs = netifaces.ifaddresses(self.find_interface(interface))
         try:
             ipv4_addr = ipaddress.IPv4Address(addrs[netifaces.AF_INET][0]['addr'])
         except Exception as e:
@@ -26,19 +30,22 @@ class Localhost:
             ipv4_addr = ipaddress.IPv4Address("127.0.0.1")
         return ipv4_addr
     
-    def get_ipv6_ip(self) -> ipaddress.IPv6Address:
-        # just find the first wired network interface
-        wired_iface_regex = re.compile(r"en[op][0-9]s[0-9]", flags=re.IGNORECASE)
-        interface: str = ""
-        for interface_iter in netifaces.interfaces():
-            if wired_iface_regex.match(str(interface_iter)):
-                interface = str(interface_iter)
-                break
-        addrs = netifaces.ifaddresses(interface)
+    def get_ipv6_ip(self, interface: str = "") -> ipaddress.IPv6Address:
+        addrs = netifaces.ifaddresses(self.find_interface(interface))
         try:
             ipv6_addr = ipaddress.IPv6Address(addrs[netifaces.AF_INET6][0]['addr'])
         except Exception as e:
             self.logger.warning(f"Unable to get IPv6 IP from localhost:\n"
                                 f"{e}")
             ipv6_addr = ipaddress.IPv6Address("::1")
-        return ipv6_addr
\ No newline at end of file
+        return ipv6_addr
+
+    def get_ipv6_global_ip(self, interface: str = "") -> ipaddress.IPv6Address:
+        # the first global address, its prefix is the one delegated to this network
+        addrs = netifaces.ifaddresses(self.find_interface(interface))
+        for addr in addrs.get(netifaces.AF_INET6, []):
+            ipv6_addr = ipaddress.IPv6Address(addr['addr'].split("%")[0])
+            if ipv6_addr.is_global:
+                return ipv6_addr
+        self.logger.warning(f"Unable to get a global IPv6 IP from localhost")
+        return ipaddress.IPv6Address("::1")
@@ -0,0 +1,69 @@
+from __future__ import annotations
+import socket
+import struct
+import pathlib
+import ipaddress
+import threading
+
+from logger import TaskLogger
+
+
+class NATPMPGateway:
+
+    PORT: int = 5351
+    ROUTE_TABLE = pathlib.Path("/proc/net/route")
+    # first retransmission after this long, doubled every time (RFC 6886 3.1)
+    RETRY_INTERVAL: float = 0.25
+    RESULT_UNSUPPORTED_VERSION: int = 1
+
+    def __init__(self, task_logger: TaskLogger, gateway: str = "", timeout: float = 2) -> None:
+        self.logger = task_logger.getChild("Local")
+        # empty for the default gateway of this host
+        self.gateway: str = gateway
+        self.timeout: float = timeout
+        self.lock = threading.Lock()
+
+    def default_gateway(self) -> str:
+        # Linux routing table, gateway of the default route as little endian hex
+        for line in self.ROUTE_TABLE.read_text().splitlines()[1:]:
+            fields = line.split()
+            if len(fields) > 3 and fields[1] == "00000000" and int(fields[3], 16) & 0x2:
+                return str(ipaddress.IPv4Address(struct.pack("<I", int(fields[2], 16))))
+        raise LookupError("No default gateway found")
+
+    def request(self, gateway: str) -> bytes:
+        # external address request: version 0, opcode 0, retransmitted until an answer or the timeout
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as pmp_socket:
+            pmp_socket.connect((gateway, self.PORT))
+            interval, waited = self.RETRY_INTERVAL, 0
+            while waited < self.timeout:
+                pmp_socket.send(b"\x00\x00")
+                pmp_socket.settimeout(min(interval, self.timeout - waited))
+                try:
+                    return pmp_socket.recv(64)
+                except socket.timeout:
+                    waited += interval
+                    interval *= 2
+        raise TimeoutError(f"No NAT-PMP answer from {gateway}")
+
+    def get_external_ip(self) -> ipaddress.IPv4Address:
+        # raises when the gateway can not tell, so the records are left alone
+        with self.lock:
+            gateway = self.gateway or self.default_gateway()
+            data = self.request(gateway)
+        if len(data) < 4:
+            raise ValueError(f"Malformed NAT-PMP answer from {gateway}")
+        version, opcode, result = struct.unpack("!BBH", data[:4])
+        if version != 0 or result == self.RESULT_UNSUPPORTED_VERSION:
+            # a PCP-only gateway, PCP has no plain address query,
+            # it would take a port mapping to learn the address
+            raise ValueError(f"Gateway {gateway} speaks PCP only, not NAT-PMP")
+        if result:
+            raise ValueError(f"NAT-PMP gateway {gateway} refused with result code {result}")
+        if opcode != 128 or len(data) < 12:
+            raise ValueError(f"Malformed NAT-PMP answer from {gateway}")
+        address = data[8:12]
+        ipv4_addr = ipaddress.IPv4Address(address)
+        if ipv4_addr.is_unspecified:
+            raise ValueError(f"NAT-PMP gateway {gateway} has no external address")
+        return ipv4_addr
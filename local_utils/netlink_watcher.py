@@ -0,0 +1,80 @@
+import socket
+import struct
+import threading
+from typing import Callable
+from logger import TaskLogger
+
+
+class NetlinkWatcher:
+
+    # from linux/rtnetlink.h
+    RTMGRP_IPV4_IFADDR: int = 0x10
+    RTMGRP_IPV6_IFADDR: int = 0x100
+    RTM_NEWADDR: int = 20
+    RTM_DELADDR: int = 21
+
+    NLMSG_HEADER = struct.Struct("=IHHII")    # length, type, flags, seq, pid
+    IFADDRMSG = struct.Struct("=BBBBI")       # family, prefixlen, flags, scope, index
+
+    def __init__(self, task_logger: TaskLogger, callback: Callable[[str], None],
+                 interfaces: set[str] = None) -> None:
+        self.logger = task_logger.getChild("Netlink")
+        # called from the watcher thread with the name of the changed interface
+        self.callback: Callable[[str], None] = callback
+        # None for every interface
+        self.interfaces: set[str] = interfaces
+        self.sock: socket.socket = None
+        self.thread: threading.Thread = None
+
+    def start(self) -> bool:
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            self.sock.bind((0, self.RTMGRP_IPV4_IFADDR | self.RTMGRP_IPV6_IFADDR))
+        except (AttributeError, OSError) as e:
+            # not on Linux, or not allowed to, polling still works
+            self.logger.warning(f"Unable to subscribe to address changes, polling only:\n"
+                                f"{e}")
+            self.sock = None
+            return False
+        self.thread = threading.Thread(target=self.run, name="netlink-watcher", daemon=True)
+        self.thread.start()
+        self.logger.info(f"Watching address changes on {sorted(self.interfaces) if self.interfaces else 'all interfaces'}")
+        return True
+
+    def stop(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def run(self):
+        while self.sock is not None:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                break
+            for interface in self.parse(data):
+                if self.interfaces is None or interface in self.interfaces:
+                    self.logger.info(f"Address changed on {interface}")
+                    try:
+                        self.callback(interface)
+                    except Exception as e:
+                        self.logger.warning(f"Address change callback failed: {e}")
+
+    def parse(self, data: bytes) -> set[str]:
+        # one datagram can carry several messages, only the interface names are needed
+        interfaces: set[str] = set()
+        offset = 0
+        while offset + self.NLMSG_HEADER.size <= len(data):
+            length, msg_type, _, _, _ = self.NLMSG_HEADER.unpack_from(data, offset)
+            if length < self.NLMSG_HEADER.size:
+                break
+            if msg_type in (self.RTM_NEWADDR, self.RTM_DELADDR):
+                _, _, _, _, index = self.IFADDRMSG.unpack_from(data, offset + self.NLMSG_HEADER.size)
+                try:
+                    interfaces.add(socket.if_indextoname(index))
+                except OSError:
+                    # the interface is already gone
+                    interfaces.add(str(index))
+            # messages are 4 bytes aligned
+            offset += (length + 3) & ~3
+        return interfaces
@@ -0,0 +1,231 @@
+from __future__ import annotations
+import time
+import asyncio
+import ipaddress
+import threading
+from typing import Any, Callable, TYPE_CHECKING
+from dataclasses import dataclass
+from concurrent.futures import Future
+
+from logger import TaskLogger
+from circuit_breaker import CircuitBreaker
+from tracing import tracer
+from metrics import source_read_seconds, source_read_failures_total
+
+if TYPE_CHECKING:
+    from .localhost import Localhost
+    from .asus_router import AsusRouter
+    from .ip_echo import IPEcho
+    from .upnp_gateway import UPnPGateway
+    from .natpmp_gateway import NATPMPGateway
+
+
+@dataclass
+class SourceReading:
+    address: ipaddress.IPv4Address | ipaddress.IPv6Address = None
+    # router only, address on the WAN port (differs from address when behind NAT)
+    wan_address: ipaddress.IPv4Address = None
+
+
+class IPObserver:
+
+    # readings are shared by every task asking within this many seconds
+    TTL: float = 30
+
+    _shared: IPObserver = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, ttl: float = TTL) -> None:
+        self.ttl: float = ttl
+        self.logger = TaskLogger(name="Observer")
+        # source handlers (and netifaces / paramiko behind them) are only loaded once a task reads them
+        self.handlers: dict[str, Any] = {}
+        self.handlers_lock = threading.Lock()
+        self.http_settings: dict = {}
+        # gateway address for the upnp / natpmp sources, empty to find it
+        self.gateway: str = ""
+        self.lock = threading.Lock()
+        self.readings: dict[tuple, tuple[float, Any]] = {}
+        self.in_flight: dict[tuple, Future] = {}
+
+    @classmethod
+    def shared(cls) -> IPObserver:
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def handler(self, source: str) -> Any:
+        with self.handlers_lock:
+            if source not in self.handlers:
+                self.handlers[source] = self.build_handler(source)
+            return self.handlers[source]
+
+    def build_handler(self, source: str) -> Any:
+        if source == "local":
+            from .localhost import Localhost
+            return Localhost(task_logger=self.logger)
+        elif source == "router":
+            from .asus_router import AsusRouter
+            from . import router_cfg
+            return AsusRouter(task_logger=self.logger,
+                              username=router_cfg.router_username,
+                              password=router_cfg.router_password,
+                              hostname=getattr(router_cfg, "router_hostname", "router.asus.com"),
+                              port=getattr(router_cfg, "router_port", 22))
+        elif source == "http":
+            from .ip_echo import IPEcho
+            http_handler = IPEcho(task_logger=self.logger)
+            http_handler.configure(**self.http_settings)
+            return http_handler
+        elif source == "upnp":
+            from .upnp_gateway import UPnPGateway
+            return UPnPGateway(task_logger=self.logger, gateway=self.gateway)
+        elif source == "natpmp":
+            from .natpmp_gateway import NATPMPGateway
+            return NATPMPGateway(task_logger=self.logger, gateway=self.gateway)
+        raise ValueError(f"Unknown source \"{source}\"")
+
+    @property
+    def local_handler(self) -> Localhost:
+        return self.handler("local")
+
+    @property
+    def router_handler(self) -> AsusRouter:
+        return self.handler("router")
+
+    @property
+    def http_handler(self) -> IPEcho:
+        return self.handler("http")
+
+    @property
+    def upnp_handler(self) -> UPnPGateway:
+        return self.handler("upnp")
+
+    @property
+    def natpmp_handler(self) -> NATPMPGateway:
+        return self.handler("natpmp")
+
+    def configure_http(self, endpoints_v4: list[str] = None, endpoints_v6: list[str] = None, quorum: int = None):
+        # kept until the http source is first used
+        self.http_settings = {"endpoints_v4": endpoints_v4, "endpoints_v6": endpoints_v6, "quorum": quorum}
+        with self.handlers_lock:
+            if "http" in self.handlers:
+                self.handlers["http"].configure(**self.http_settings)
+
+    def configure_gateway(self, address: str = ""):
+        self.gateway = address or ""
+        with self.handlers_lock:
+            for source in ("upnp", "natpmp"):
+                if source in self.handlers:
+                    self.handlers[source].gateway = self.gateway
+            if "upnp" in self.handlers:
+                # looked up again at the new address
+                self.handlers["upnp"].control = None
+        self.invalidate_source("upnp")
+        self.invalidate_source("natpmp")
+
+    def breaker(self, key: tuple) -> CircuitBreaker:
+        # one per (source, type, interface), a hung interface does not stop the others
+        return CircuitBreaker.shared(key=("source", *key), name=" ".join(["source", *filter(None, key)]))
+
+    def claim(self, key: tuple) -> tuple[Future, bool]:
+        # returns the future to wait on, and whether the caller has to resolve it
+        with self.lock:
+            reading = self.readings.get(key)
+            if reading and time.monotonic() - reading[0] < self.ttl:
+                future = Future()
+                future.set_result(reading[1])
+                return future, False
+            if key in self.in_flight:
+                return self.in_flight[key], False
+            future = self.in_flight[key] = Future()
+            return future, True
+
+    def resolve(self, key: tuple, future: Future, fetch: Callable[[], Any]):
+        try:
+            with (source_read_seconds.time(source=key[0], type=key[1]),
+                  tracer.span("source.read", source=key[0], type=key[1], interface=key[2])):
+                value = fetch()
+        except BaseException as e:
+            source_read_failures_total.inc(source=key[0], type=key[1])
+            with self.lock:
+                self.in_flight.pop(key, None)
+            future.set_exception(e)
+        else:
+            with self.lock:
+                self.readings[key] = (time.monotonic(), value)
+                self.in_flight.pop(key, None)
+            future.set_result(value)
+
+    def invalidate(self, key: tuple = None):
+        with self.lock:
+            if key is None:
+                self.readings.clear()
+            else:
+                self.readings.pop(key, None)
+
+    def invalidate_source(self, source: str):
+        with self.lock:
+            for key in [key for key in self.readings if key[0] == source]:
+                self.readings.pop(key)
+
+    def observe(self, key: tuple, fetch: Callable[[], Any]) -> Any:
+        future, owner = self.claim(key)
+        tracer.annotate(shared=not owner)
+        if owner:
+            self.resolve(key, future, fetch)
+        return future.result()
+
+    async def async_observe(self, key: tuple, fetch: Callable[[], Any]) -> Any:
+        # waiters do not hold an executor thread, only the owner does the blocking call,
+        # a caller giving up (cycle deadline) leaves the lookup running for the others
+        future, owner = self.claim(key)
+        # whether the reading came from another caller's lookup (or the TTL), not this one
+        tracer.annotate(shared=not owner)
+        if owner:
+            await asyncio.shield(asyncio.to_thread(self.resolve, key, future, fetch))
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def reading_fetcher(self, source: str, type: str, interface: str = "") -> Callable[[], SourceReading]:
+        if source == "local":
+            if type == "A":
+                return lambda: SourceReading(address=self.local_handler.get_ipv4_ip(interface))
+            elif type == "AAAA":
+                return lambda: SourceReading(address=self.local_handler.get_ipv6_ip(interface))
+        elif source == "prefix":
+            if type == "AAAA":
+                return lambda: SourceReading(address=self.local_handler.get_ipv6_global_ip(interface))
+        elif source == "router":
+            if type == "A":
+                return self.read_router_ipv4
+        elif source == "http":
+            if type == "A":
+                return lambda: SourceReading(address=self.http_handler.get_ipv4_ip())
+            elif type == "AAAA":
+                return lambda: SourceReading(address=self.http_handler.get_ipv6_ip())
+        elif source in ("upnp", "natpmp"):
+            if type == "A":
+                return lambda: self.read_gateway_ipv4(self.upnp_handler if source == "upnp" else self.natpmp_handler)
+        return None
+
+    def read_router_ipv4(self) -> SourceReading:
+        wan_ip, real_ip = self.router_handler.get_wan_info()
+        return SourceReading(address=real_ip, wan_address=wan_ip)
+
+    def read_gateway_ipv4(self, gateway_handler: UPnPGateway | NATPMPGateway) -> SourceReading:
+        # the gateway reports its WAN address, the same as the public one unless it is behind another NAT
+        wan_ip = gateway_handler.get_external_ip()
+        return SourceReading(address=wan_ip, wan_address=wan_ip)
+
+    def read(self, source: str, type: str, interface: str = "") -> SourceReading:
+        fetch = self.reading_fetcher(source, type, interface)
+        if fetch is None:
+            return None
+        return self.observe((source, type, interface), fetch)
+
+    async def async_read(self, source: str, type: str, interface: str = "") -> SourceReading:
+        fetch = self.reading_fetcher(source, type, interface)
+        if fetch is None:
+            return None
+        return await self.async_observe((source, type, interface), fetch)
@@ -7,3 +7,6 @@ Rename this file to "router_cfg.py", and input your own infomations and tasks
 
 router_username = "example_username"
 router_password = "example_password"
+# optional, where the router accepts SSH connections
+router_hostname = "router.asus.com"
+router_port = 22
@@ -0,0 +1,119 @@
+from __future__ import annotations
+import time
+import socket
+import ipaddress
+import threading
+import urllib.request
+from urllib.parse import urljoin
+from xml.etree import ElementTree
+
+from logger import TaskLogger
+
+
+class UPnPGateway:
+
+    SSDP_ADDRESS: str = "239.255.255.250"
+    SSDP_PORT: int = 1900
+    SEARCH_TARGETS: tuple[str, ...] = ("urn:schemas-upnp-org:device:InternetGatewayDevice:2",
+                                       "urn:schemas-upnp-org:device:InternetGatewayDevice:1")
+    # services of an IGD answering GetExternalIPAddress, the first one found is used
+    SERVICE_TYPES: tuple[str, ...] = ("urn:schemas-upnp-org:service:WANIPConnection:2",
+                                      "urn:schemas-upnp-org:service:WANIPConnection:1",
+                                      "urn:schemas-upnp-org:service:WANPPPConnection:1")
+    DEVICE_NAMESPACE: str = "{urn:schemas-upnp-org:device-1-0}"
+
+    def __init__(self, task_logger: TaskLogger, gateway: str = "", timeout: float = 2) -> None:
+        self.logger = task_logger.getChild("Local")
+        # empty to search by multicast, otherwise the search is sent to the gateway only
+        self.gateway: str = gateway
+        self.timeout: float = timeout
+        # (control URL, service type) of the gateway, kept until a request on it fails
+        self.control: tuple[str, str] = None
+        self.lock = threading.Lock()
+
+    def search(self) -> list[str]:
+        # SSDP M-SEARCH, returns the description URLs (LOCATION) of the gateways answering
+        locations: list[str] = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as ssdp_socket:
+            ssdp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+            ssdp_socket.settimeout(self.timeout)
+            for search_target in self.SEARCH_TARGETS:
+                message = (f"M-SEARCH * HTTP/1.1\r\n"
+                           f"HOST: {self.SSDP_ADDRESS}:{self.SSDP_PORT}\r\n"
+                           f"MAN: \"ssdp:discover\"\r\n"
+                           f"MX: {max(1, int(self.timeout))}\r\n"
+                           f"ST: {search_target}\r\n\r\n")
+                ssdp_socket.sendto(message.encode(), (self.gateway or self.SSDP_ADDRESS, self.SSDP_PORT))
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                ssdp_socket.settimeout(max(0.01, deadline - time.monotonic()))
+                try:
+                    data, _ = ssdp_socket.recvfrom(65535)
+                except socket.timeout:
+                    break
+                for line in data.decode("utf-8", "replace").splitlines():
+                    name, _, value = line.partition(":")
+                    if name.strip().lower() == "location" and value.strip() not in locations:
+                        locations.append(value.strip())
+                if locations:
+                    # one gateway is enough, others answering late are ignored
+                    break
+        return locations
+
+    def find_control(self, location: str) -> tuple[str, str]:
+        with urllib.request.urlopen(location, timeout=self.timeout) as response:
+            description = ElementTree.fromstring(response.read())
+        base_url = description.findtext(f"{self.DEVICE_NAMESPACE}URLBase") or location
+        services = {service.findtext(f"{self.DEVICE_NAMESPACE}serviceType"):
+                    service.findtext(f"{self.DEVICE_NAMESPACE}controlURL")
+                    for service in description.iter(f"{self.DEVICE_NAMESPACE}service")}
+        for service_type in self.SERVICE_TYPES:
+            if services.get(service_type):
+                return urljoin(base_url, services[service_type]), service_type
+        return None
+
+    def discover(self) -> tuple[str, str]:
+        for location in self.search():
+            try:
+                control = self.find_control(location)
+            except Exception as e:
+                self.logger.info(f"Unable to read UPnP device description at {location}: {e}")
+                continue
+            if control:
+                self.logger.info(f"UPnP gateway control URL is {control[0]}")
+                return control
+        raise LookupError("No UPnP internet gateway answered")
+
+    def query(self, control: tuple[str, str]) -> ipaddress.IPv4Address:
+        control_url, service_type = control
+        body = (f"<?xml version=\"1.0\"?>"
+                f"<s:Envelope xmlns:s=\"http://schemas.xmlsoap.org/soap/envelope/\" "
+                f"s:encodingStyle=\"http://schemas.xmlsoap.org/soap/encoding/\">"
+                f"<s:Body><u:GetExternalIPAddress xmlns:u=\"{service_type}\"/></s:Body></s:Envelope>")
+        request = urllib.request.Request(control_url, data=body.encode(), method="POST",
+                                         headers={"Content-Type": "text/xml; charset=\"utf-8\"",
+                                                  "SOAPAction": f"\"{service_type}#GetExternalIPAddress\""})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            envelope = ElementTree.fromstring(response.read())
+        address = next((element.text for element in envelope.iter()
+                        if element.tag.rpartition("}")[2] == "NewExternalIPAddress"), "")
+        ipv4_addr = ipaddress.IPv4Address((address or "").strip())
+        if ipv4_addr.is_unspecified:
+            # some gateways report 0.0.0.0 while the WAN link is down
+            raise ValueError("UPnP gateway has no external address")
+        return ipv4_addr
+
+    def get_external_ip(self) -> ipaddress.IPv4Address:
+        # raises when the gateway can not tell, so the records are left alone
+        with self.lock:
+            if self.control is not None:
+                try:
+                    return self.query(self.control)
+                except OSError as e:
+                    # the gateway might have rebooted (new port) or changed, look for it again
+                    self.logger.info(f"UPnP gateway at {self.control[0]} failed, discovering again: {e}")
+                    self.control = None
+            control = self.discover()
+            ipv4_addr = self.query(control)
+            self.control = control
+            return ipv4_addr
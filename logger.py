@@ -1,32 +1,146 @@
+from __future__ import annotations
 import sys
+import time
+import queue
+import atexit
 import logging
 import pathlib
+import threading
 from logging import Logger, handlers
-from systemd import journal
 
 
-class TaskLogger(logging.Logger):
+LOG_DIR = pathlib.Path(__file__).absolute().parent.joinpath("logs")
 
-    def __new__(cls, name: str, level: int | str = logging.INFO) -> Logger:
-        new_logger = logging.getLogger(name=name)
-        new_logger.setLevel(level=level)
 
-        # log file path
-        log_file = pathlib.Path(__file__).absolute().parent.joinpath("logs").joinpath(name + ".log")
-        # set formatter
-        formatter = logging.Formatter('%(asctime)s | %(name)s - %(levelname)s | %(message)s')
+class LazyQueueHandler(handlers.QueueHandler):
+
+    def __init__(self, log_queue: queue.SimpleQueue, task_name: str) -> None:
+        super().__init__(log_queue)
+        self.task_name: str = task_name
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting (and str() of big debug payloads) is left to the writer thread
+        if not hasattr(record, "task_name"):
+            record.task_name = self.task_name
+        return record
+
+
+class RepeatFilter(logging.Filter):
+
+    # the same message of a task is written once per window, repeats are counted instead
+    WINDOW: float = 600
+    # only chatty levels are coalesced, warnings always go through
+    MAX_LEVEL: int = logging.INFO
+    MAX_ENTRIES: int = 1024
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lock = threading.Lock()
+        self.seen: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.MAX_LEVEL or not isinstance(record.msg, str):
+            return True
+        try:
+            key = (record.name, record.levelno, record.msg, record.args)
+            hash(key)
+        except TypeError:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry and now - entry[0] < self.WINDOW:
+                entry[1] += 1
+                return False
+            if entry and entry[1]:
+                record.msg = f"{record.msg} (repeated {entry[1]} more time(s) in the last {now - entry[0]:.0f}s)"
+            self.seen[key] = [now, 0]
+            if len(self.seen) > self.MAX_ENTRIES:
+                self.seen = {key: entry for key, entry in self.seen.items() if now - entry[0] < self.WINDOW}
+        return True
+
+
+class TaskFileHandler(logging.Handler):
+
+    # one rotating file per task, opened by the writer thread on first use
+    def __init__(self, formatter: logging.Formatter) -> None:
+        super().__init__()
+        self.setFormatter(formatter)
+        self.files: dict[str, handlers.TimedRotatingFileHandler] = {}
+
+    def emit(self, record: logging.LogRecord):
+        task_name = getattr(record, "task_name", record.name)
+        file_handler = self.files.get(task_name)
+        if file_handler is None:
+            file_handler = handlers.TimedRotatingFileHandler(
+                filename=LOG_DIR.joinpath(task_name + ".log"), backupCount=20,
+                when="midnight", interval=1, delay=True)
+            file_handler.setFormatter(self.formatter)
+            self.files[task_name] = file_handler
+        file_handler.handle(record)
 
-        # add handlers
-        journal_handler = journal.JournalHandler()
-        journal_handler.setFormatter(formatter)
-        new_logger.addHandler(journal_handler)
+    def close(self):
+        for file_handler in self.files.values():
+            file_handler.close()
+        super().close()
+
+
+class LogPipeline:
+
+    # every task logger puts records on one queue, a single background thread writes them out
+    _shared: LogPipeline = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        formatter = logging.Formatter('%(asctime)s | %(name)s - %(levelname)s | %(message)s')
         stdout_handler = logging.StreamHandler(sys.stdout)
         stdout_handler.setFormatter(formatter)
-        new_logger.addHandler(stdout_handler)
-        file_handler = handlers.TimedRotatingFileHandler(
-            filename=log_file, backupCount=20,
-            when="midnight", interval=1)
-        file_handler.setFormatter(formatter)
-        new_logger.addHandler(file_handler)
+        log_handlers = [stdout_handler, TaskFileHandler(formatter)]
+        journal_handler = self.journal_handler()
+        if journal_handler is not None:
+            journal_handler.setFormatter(formatter)
+            log_handlers.insert(0, journal_handler)
+        self.listener = handlers.QueueListener(self.queue, *log_handlers, respect_handler_level=True)
+        self.repeat_filter = RepeatFilter()
+        self.listener.start()
+        atexit.register(self.stop)
+
+    @staticmethod
+    def journal_handler() -> logging.Handler:
+        # systemd journal only when cysystemd is installed, imported on first use
+        try:
+            from systemd import journal
+        except ImportError:
+            return None
+        return journal.JournalHandler()
+
+    @classmethod
+    def shared(cls) -> LogPipeline:
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def attach(self, logger: Logger, task_name: str):
+        # idempotent, creating a task with the same name again does not stack handlers
+        if any(isinstance(handler, LazyQueueHandler) for handler in logger.handlers):
+            return
+        queue_handler = LazyQueueHandler(self.queue, task_name)
+        queue_handler.addFilter(self.repeat_filter)
+        logger.addHandler(queue_handler)
 
+    def stop(self):
+        # flushes what is still queued
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+class TaskLogger(logging.Logger):
+
+    def __new__(cls, name: str, level: int | str = logging.INFO) -> Logger:
+        new_logger = logging.getLogger(name=name)
+        new_logger.setLevel(level=level)
+        LogPipeline.shared().attach(new_logger, task_name=name)
         return new_logger
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Metric:
+
+    TYPE: str = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.labels: tuple[str, ...] = labels
+        self.lock = threading.Lock()
+        self.values: dict[tuple, object] = {}
+
+    def label_values(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def format_labels(self, values: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labels, values)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+                   for _, value in pairs)
+        return "{" + ",".join(f"{label}=\"{value}\"" for (label, _), value in zip(pairs, escaped)) + "}"
+
+    def samples(self) -> list[str]:
+        return []
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        with self.lock:
+            lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list[str]:
+        return [f"{self.name}{self.format_labels(key)} {value}" for key, value in self.values.items()]
+
+
+class Gauge(Metric):
+
+    TYPE = "gauge"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), since: bool = False) -> None:
+        super().__init__(name, help, labels)
+        # report the seconds elapsed since the stored timestamp instead of the value itself
+        self.since: bool = since
+
+    def set(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_to_current_time(self, **labels):
+        self.set(time.time(), **labels)
+
+    def setdefault(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values.setdefault(key, value)
+
+    def remove(self, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values.pop(key, None)
+
+    def samples(self) -> list[str]:
+        now = time.time()
+        return [f"{self.name}{self.format_labels(key)} {now - value if self.since else value}"
+                for key, value in self.values.items()]
+
+
+class Histogram(Metric):
+
+    TYPE = "histogram"
+    # seconds, from a local netifaces call to a slow API call over a proxy
+    BUCKETS: tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets: tuple[float, ...] = buckets
+
+    def observe(self, value: float, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            # per-bucket counts (not cumulative) plus the +Inf slot, then sum
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{self.format_labels(key, {'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{self.format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{self.format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+api_call_seconds: Histogram = registry.register(Histogram(
+    "ddns_api_call_seconds", "Latency of DNS API handler methods", ("provider", "method")))
+api_responses_total: Counter = registry.register(Counter(
+    "ddns_api_responses_total", "HTTP responses from DNS APIs by status code, 'error' if none came back",
+    ("provider", "method", "status")))
+source_read_seconds: Histogram = registry.register(Histogram(
+    "ddns_source_read_seconds", "Latency of address lookups (Localhost, AsusRouter)", ("source", "type")))
+ip_echo_seconds: Histogram = registry.register(Histogram(
+    "ddns_ip_echo_seconds", "Latency of successful IP echo endpoint answers", ("endpoint",)))
+source_read_failures_total: Counter = registry.register(Counter(
+    "ddns_source_read_failures_total", "Failed address lookups", ("source", "type")))
+cycle_seconds: Histogram = registry.register(Histogram(
+    "ddns_cycle_seconds", "Duration of one DDNSTask main() cycle", ("task",)))
+record_changes_total: Counter = registry.register(Counter(
+    "ddns_record_changes_total", "Record pushes and deletes by result", ("task", "action", "result")))
+record_seconds_since_sync: Gauge = registry.register(Gauge(
+    "ddns_record_seconds_since_sync", "Seconds since the record was last confirmed up to date",
+    ("task", "name", "type"), since=True))
+circuit_open: Gauge = registry.register(Gauge(
+    "ddns_circuit_open", "1 while calls to a source or provider are skipped after repeated timeouts", ("breaker",)))
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes are not worth a log line each
+        pass
+
+
+class MetricsServer:
+
+    def __init__(self, port: int, host: str = "127.0.0.1") -> None:
+        self.server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,168 @@
+from __future__ import annotations
+import ipaddress
+from typing import Literal
+from dataclasses import dataclass, field
+
+from dns_api import RECORD_TYPE
+from dns_api.utils import DNSRecord, DNSRecordChange
+
+
+PLAN_ACTION = Literal["create", "update", "delete", "lookup", "noop"]
+# address records are held as packed integers, everything else as text
+ADDRESS_CLASSES: dict[str, type] = {"A": ipaddress.IPv4Address, "AAAA": ipaddress.IPv6Address}
+
+
+def pack_value(type: RECORD_TYPE, value: str) -> int | str:
+    if type in ADDRESS_CLASSES and value:
+        try:
+            return int(ADDRESS_CLASSES[type](value))
+        except ValueError:
+            return value
+    return value
+
+
+def unpack_value(type: RECORD_TYPE, value: int | str) -> str:
+    if isinstance(value, int):
+        return str(ADDRESS_CLASSES[type](value))
+    return value
+
+
+@dataclass(slots=True)
+class StoredRecord:
+    name: str
+    type: RECORD_TYPE
+    value: int | str = ""
+    id: str = ""
+    ttl: int = 600
+    comment: str = ""
+
+    @classmethod
+    def from_record(cls, record: DNSRecord) -> StoredRecord:
+        return cls(name=record.name, type=record.type, value=pack_value(record.type, record.value),
+                   id=record.id, ttl=record.ttl, comment=record.comment)
+
+    def to_record(self, domain: str) -> DNSRecord:
+        return DNSRecord(id=self.id, domain=domain, name=self.name, type=self.type,
+                         value=unpack_value(self.type, self.value), ttl=self.ttl, comment=self.comment)
+
+
+class RecordStore:
+
+    # observed state of one zone, records known to be missing are kept apart from records never looked at
+
+    def __init__(self, domain: str) -> None:
+        self.domain: str = domain
+        self.by_key: dict[tuple[str, str], StoredRecord] = {}
+        self.by_id: dict[str, StoredRecord] = {}
+        self.absent: set[tuple[str, str]] = set()
+
+    def __len__(self) -> int:
+        return len(self.by_key)
+
+    def known(self, name: str, type: RECORD_TYPE) -> bool:
+        return (name, type) in self.by_key or (name, type) in self.absent
+
+    def get(self, name: str, type: RECORD_TYPE) -> StoredRecord:
+        return self.by_key.get((name, type))
+
+    def get_by_id(self, id: str) -> StoredRecord:
+        return self.by_id.get(id)
+
+    def record(self, name: str, type: RECORD_TYPE) -> DNSRecord:
+        stored = self.by_key.get((name, type))
+        return stored.to_record(self.domain) if stored else None
+
+    def put(self, name: str, type: RECORD_TYPE, record: DNSRecord | None):
+        # None records the name and type as missing on the provider side
+        self.forget(name, type)
+        if record is None:
+            self.absent.add((name, type))
+            return
+        stored = StoredRecord.from_record(record)
+        self.by_key[(name, type)] = stored
+        if stored.id:
+            self.by_id[stored.id] = stored
+
+    def forget(self, name: str, type: RECORD_TYPE):
+        self.absent.discard((name, type))
+        stored = self.by_key.pop((name, type), None)
+        if stored is not None and stored.id:
+            self.by_id.pop(stored.id, None)
+
+
+@dataclass(slots=True)
+class PlanItem:
+    action: PLAN_ACTION
+    name: str
+    type: RECORD_TYPE
+    # desired value, and the observed one it replaces
+    value: int | str = ""
+    old_value: int | str = ""
+    id: str = ""
+
+
+@dataclass
+class ChangePlan:
+    domain: str = ""
+    items: list[PlanItem] = field(default_factory=list)
+
+    @property
+    def changes(self) -> list[PlanItem]:
+        return [item for item in self.items if item.action not in ("noop", "lookup")]
+
+    @property
+    def lookups(self) -> list[PlanItem]:
+        return [item for item in self.items if item.action == "lookup"]
+
+    def record_change(self, item: PlanItem) -> DNSRecordChange:
+        record = DNSRecord(id=item.id, domain=self.domain, name=item.name, type=item.type,
+                           value=unpack_value(item.type, item.value))
+        return DNSRecordChange(action="delete" if item.action == "delete" else "set", record=record)
+
+    def summary(self) -> str:
+        counts = {action: 0 for action in ("create", "update", "delete", "lookup", "noop")}
+        for item in self.items:
+            counts[item.action] += 1
+        return ", ".join(f"{count} {action}" for action, count in counts.items())
+
+    def render(self) -> str:
+        # dry run output, one line per change
+        symbols = {"create": "+", "update": "~", "delete": "-", "lookup": "?"}
+        lines = [f"Plan for {self.domain}: {self.summary()}"]
+        for item in self.changes + self.lookups:
+            old_value = unpack_value(item.type, item.old_value)
+            value = unpack_value(item.type, item.value)
+            line = f"  {symbols[item.action]} {item.type:<5} {item.name}"
+            if item.action in ("create", "lookup"):
+                line += f" {value}"
+            elif item.action == "update":
+                line += f" {old_value} -> {value}"
+            else:
+                line += f" {old_value}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class Reconciler:
+
+    @staticmethod
+    def plan(desired: dict[tuple[str, str], int | str | None], observed: RecordStore) -> ChangePlan:
+        # desired maps (name, type) to a value, or None for a record that should not exist,
+        # records without an opinion are left out
+        plan = ChangePlan(domain=observed.domain)
+        for (name, type), value in desired.items():
+            stored = observed.by_key.get((name, type))
+            if value is None:
+                # records never looked at are not deleted blindly
+                action = "delete" if stored is not None and stored.value != "" else "noop"
+            elif stored is None:
+                # only a record confirmed missing is created, one never read (or whose lookup failed)
+                # might exist already
+                action = "create" if (name, type) in observed.absent else "lookup"
+            else:
+                action = "noop" if stored.value == value else "update"
+            plan.items.append(PlanItem(action=action, name=name, type=type,
+                                       value=value if value is not None else "",
+                                       old_value=stored.value if stored else "",
+                                       id=stored.id if stored else ""))
+        return plan
@@ -0,0 +1,114 @@
+import time
+import heapq
+import random
+import itertools
+from typing import Hashable, Literal
+from dataclasses import dataclass, field
+
+
+OUTCOME = Literal["unchanged", "changed", "failed"]
+
+
+@dataclass
+class SchedulePolicy:
+    # steady state, next check in interval +/- jitter seconds
+    interval: float = 90
+    jitter: float = 30
+    # right after a change, re-check a few times quicker in case the address is unstable
+    fast_interval: float = 15
+    fast_checks: int = 3
+    # after consecutive failures, wait backoff_base * 2 ** (failures - 1), up to backoff_max
+    backoff_base: float = 15
+    backoff_max: float = 900
+
+    def next_delay(self, failures: int = 0, fast_checks_left: int = 0) -> float:
+        if failures:
+            delay = min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+            # full jitter on the upper half, so failing tasks do not retry in lock step
+            return random.uniform(delay / 2, delay)
+        if fast_checks_left:
+            return self.fast_interval
+        return max(0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+
+@dataclass(order=True)
+class ScheduleEntry:
+    due: float
+    seq: int
+    key: Hashable = field(compare=False)
+
+
+@dataclass
+class ScheduleState:
+    policy: SchedulePolicy
+    failures: int = 0
+    fast_checks_left: int = 0
+
+
+class Scheduler:
+
+    def __init__(self) -> None:
+        self.heap: list[ScheduleEntry] = []
+        # the current entry of each key, entries replaced in the heap are skipped lazily
+        self.entries: dict[Hashable, ScheduleEntry] = {}
+        self.states: dict[Hashable, ScheduleState] = {}
+        self.counter = itertools.count()
+
+    def add(self, key: Hashable, policy: SchedulePolicy, delay: float = 0):
+        self.states[key] = ScheduleState(policy=policy)
+        self.schedule(key, delay)
+
+    def remove(self, key: Hashable):
+        self.entries.pop(key, None)
+        self.states.pop(key, None)
+
+    def schedule(self, key: Hashable, delay: float):
+        entry = ScheduleEntry(due=time.monotonic() + delay, seq=next(self.counter), key=key)
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+
+    def wake(self, key: Hashable, delay: float = 0):
+        # bring a key forward, never push it back
+        entry = self.entries.get(key)
+        if key in self.states and (entry is None or entry.due > time.monotonic() + delay):
+            self.schedule(key, delay)
+
+    def report(self, key: Hashable, outcome: OUTCOME):
+        state = self.states.get(key)
+        if state is None:
+            return
+        if outcome == "failed":
+            state.failures += 1
+        else:
+            state.failures = 0
+            if outcome == "changed":
+                state.fast_checks_left = state.policy.fast_checks
+            elif state.fast_checks_left:
+                state.fast_checks_left -= 1
+        delay = state.policy.next_delay(state.failures, state.fast_checks_left)
+        # a wake-up that came in while the key was being processed is kept
+        entry = self.entries.get(key)
+        if entry is None or entry.due > time.monotonic() + delay:
+            self.schedule(key, delay)
+
+    def time_until_next(self) -> float:
+        while self.heap and self.entries.get(self.heap[0].key) is not self.heap[0]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0, self.heap[0].due - time.monotonic())
+
+    def take(self, key: Hashable) -> bool:
+        # take a key out ahead of time, it is scheduled again when reported
+        return self.entries.pop(key, None) is not None
+
+    def pop_due(self) -> list[Hashable]:
+        # due keys are taken out until they are reported or scheduled again
+        now = time.monotonic()
+        keys = []
+        while self.heap and self.heap[0].due <= now:
+            entry = heapq.heappop(self.heap)
+            if self.entries.get(entry.key) is entry:
+                del self.entries[entry.key]
+                keys.append(entry.key)
+        return keys
@@ -0,0 +1,65 @@
+from __future__ import annotations
+import time
+import pathlib
+import sqlite3
+import threading
+
+from dns_api.utils import DNSRecord
+
+
+class StateStore:
+
+    DEFAULT_PATH = pathlib.Path(__file__).absolute().parent.joinpath("state").joinpath("ddns_state.sqlite3")
+    # older state is not trusted for a warm start (seconds)
+    MAX_AGE: float = 86400
+
+    _shared: StateStore = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: pathlib.Path = DEFAULT_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            # present = 0 records that the record was confirmed to not exist
+            self.connection.execute("CREATE TABLE IF NOT EXISTS records ("
+                                    "zone TEXT, name TEXT, type TEXT, present INTEGER, "
+                                    "id TEXT, value TEXT, ttl INTEGER, comment TEXT, updated_at REAL, "
+                                    "PRIMARY KEY (zone, name, type))")
+            # source readings were stored by earlier versions, nothing reads them
+            self.connection.execute("DROP TABLE IF EXISTS sources")
+
+    @classmethod
+    def shared(cls, path: pathlib.Path = DEFAULT_PATH) -> StateStore:
+        # the path only matters to the first caller
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(path)
+            return cls._shared
+
+    def save_records(self, zone: str, records: list[tuple[str, str, DNSRecord]]):
+        # (name, type, record), record is the last confirmed remote record, None if it does not exist
+        now = time.time()
+        rows = [(zone, name, type, record is not None,
+                 record.id if record else "", record.value if record else "",
+                 record.ttl if record else 0, (record.comment or "") if record else "", now)
+                for name, type, record in records]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def discard_records(self, zone: str, keys: list[tuple[str, str]]):
+        # (name, type) of records whose remote state is no longer known
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM records WHERE zone = ? AND name = ? AND type = ?",
+                                        [(zone, name, type) for name, type in keys])
+
+    def load_records(self, zone: str, domain: str) -> dict[tuple[str, str], DNSRecord]:
+        # maps (name, type) to the stored record, or None if it was confirmed missing
+        with self.lock:
+            rows = self.connection.execute("SELECT name, type, present, id, value, ttl, comment FROM records "
+                                           "WHERE zone = ? AND updated_at > ?",
+                                           (zone, time.time() - self.MAX_AGE)).fetchall()
+        return {(name, type): DNSRecord(id=id, domain=domain, name=name, type=type,
+                                        value=value, ttl=ttl, comment=comment) if present else None
+                for name, type, present, id, value, ttl, comment in rows}
@@ -0,0 +1,102 @@
+import json
+import pathlib
+import argparse
+
+from tracing import Span
+
+
+TOP: int = 10
+CYCLES: int = 3
+# attributes shown next to a span name, in this order
+SHOWN_ATTRIBUTES: tuple[str, ...] = ("zone", "provider", "source", "type", "interface", "method", "path",
+                                     "record", "action", "host", "shared", "status", "bytes", "retries", "plan",
+                                     "changes", "changed", "failed", "result", "error")
+
+
+def load_spans(path: pathlib.Path) -> list[Span]:
+    spans: list[Span] = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                spans.append(Span.from_dict(json.loads(line)))
+            except (ValueError, KeyError):
+                # a line cut short by a stopped process
+                continue
+    return spans
+
+
+def describe(span: Span) -> str:
+    attributes = " ".join(f"{name}={span.attributes[name]}" for name in SHOWN_ATTRIBUTES
+                          if span.attributes.get(name) not in (None, ""))
+    return f"{span.name} {attributes}".rstrip() + (" [error]" if span.status == "error" else "")
+
+
+def critical_path(span: Span, children: dict[str, list[Span]], depth: int = 0) -> list[tuple[int, Span]]:
+    # walks back from the end of the span: the child finishing last, then the one finishing last
+    # before that child started, and so on, each of them expanded the same way
+    chain: list[Span] = []
+    cursor = span.end
+    for child in sorted(children.get(span.span_id, []), key=lambda child: child.end, reverse=True):
+        if child.end <= cursor:
+            chain.append(child)
+            cursor = child.start
+    path = [(depth, span)]
+    for child in reversed(chain):
+        path.extend(critical_path(child, children, depth + 1))
+    return path
+
+
+def summarize(spans: list[Span], top: int = TOP, cycles: int = CYCLES, zone: str = ""):
+    traces: dict[str, list[Span]] = {}
+    for span in spans:
+        traces.setdefault(span.trace_id, []).append(span)
+    roots: list[Span] = []
+    for trace_spans in traces.values():
+        span_ids = {span.span_id for span in trace_spans}
+        trace_roots = [span for span in trace_spans if span.parent_id not in span_ids]
+        if zone and not any(root.attributes.get("zone") == zone for root in trace_roots):
+            continue
+        roots.extend(trace_roots)
+    kept_traces = {root.trace_id for root in roots}
+    spans = [span for span in spans if span.trace_id in kept_traces]
+    if not spans:
+        print("No spans")
+        return
+
+    print(f"{len(spans)} spans in {len(kept_traces)} cycle(s)\n")
+
+    print("Slowest spans")
+    for span in sorted(spans, key=lambda span: span.duration, reverse=True)[:top]:
+        print(f"{span.duration * 1000:>10.1f} ms  {describe(span)}")
+
+    print(f"\nBy name{'':<18}{'count':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}{'errors':>8}")
+    names: dict[str, list[Span]] = {}
+    for span in spans:
+        names.setdefault(span.name, []).append(span)
+    for name, named_spans in sorted(names.items(), key=lambda item: -sum(span.duration for span in item[1])):
+        total = sum(span.duration for span in named_spans)
+        print(f"{name:<25}{len(named_spans):>8}{total * 1000:>12.1f}{total / len(named_spans) * 1000:>10.1f}"
+              f"{max(span.duration for span in named_spans) * 1000:>10.1f}"
+              f"{sum(span.status == 'error' for span in named_spans):>8}")
+
+    children: dict[str, list[Span]] = {}
+    for span in spans:
+        children.setdefault(span.parent_id, []).append(span)
+    for root in sorted(roots, key=lambda root: root.duration, reverse=True)[:cycles]:
+        print(f"\nCritical path of {root.trace_id[:16]}, {root.duration * 1000:.1f} ms")
+        for depth, span in critical_path(root, children):
+            print(f"{span.duration * 1000:>10.1f} ms  {'  ' * depth}{describe(span)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slowest spans and critical paths of the cycles in a trace file")
+    parser.add_argument("trace_file", type=pathlib.Path)
+    parser.add_argument("--top", type=int, default=TOP, help="slowest spans listed")
+    parser.add_argument("--cycles", type=int, default=CYCLES, help="slowest cycles whose critical path is shown")
+    parser.add_argument("--zone", default="", help="only cycles of this zone, e.g. Cloudflare@\"example.com\"")
+    args = parser.parse_args()
+    summarize(load_spans(args.trace_file), top=args.top, cycles=args.cycles, zone=args.zone)
+
+
+if __name__ == "__main__":
+    main()
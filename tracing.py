@@ -0,0 +1,138 @@
+from __future__ import annotations
+import json
+import time
+import pathlib
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+ROOT = pathlib.Path(__file__).absolute().parent
+
+
+@dataclass(slots=True)
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: str = ""
+    # epoch seconds
+    start: float = 0
+    end: float = 0
+    attributes: dict = field(default_factory=dict)
+    status: str = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        # field names of an OTLP span, attributes kept as a plain object
+        return {"traceId": self.trace_id, "spanId": self.span_id, "parentSpanId": self.parent_id,
+                "name": self.name, "startTimeUnixNano": int(self.start * 1e9),
+                "endTimeUnixNano": int(self.end * 1e9), "attributes": self.attributes,
+                "status": {"code": "STATUS_CODE_ERROR" if self.status == "error" else "STATUS_CODE_OK"}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> Span:
+        return cls(name=data["name"], trace_id=data["traceId"], span_id=data["spanId"],
+                   parent_id=data.get("parentSpanId", ""),
+                   start=data["startTimeUnixNano"] / 1e9, end=data["endTimeUnixNano"] / 1e9,
+                   attributes=data.get("attributes", {}),
+                   status="error" if data.get("status", {}).get("code") == "STATUS_CODE_ERROR" else "ok")
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class NullSpan:
+
+    # handed out while tracing is off, attributes go nowhere
+    def set(self, **attributes):
+        pass
+
+
+NULL_SPAN = NullSpan()
+# span of the running code, copied into asyncio tasks and asyncio.to_thread calls
+current_span: contextvars.ContextVar[Span] = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+
+    _shared: Tracer = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.path: pathlib.Path = None
+        self.file = None
+
+    @classmethod
+    def shared(cls) -> Tracer:
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @property
+    def enabled(self) -> bool:
+        return self.file is not None
+
+    def configure(self, path: str = ""):
+        # spans are appended to the file as JSON lines, an empty path turns tracing off
+        path = ROOT.joinpath(path) if path else None
+        with self.lock:
+            if path == self.path:
+                return
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.path = path
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self.file = open(path, "a", encoding="utf-8")
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if self.file is None:
+            yield NULL_SPAN
+            return
+        parent = current_span.get()
+        span = Span(name=name, trace_id=parent.trace_id if parent else secrets.token_hex(16),
+                    span_id=secrets.token_hex(8), parent_id=parent.span_id if parent else "",
+                    start=time.time(), attributes=attributes)
+        token = current_span.set(span)
+        started_at = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            span.end = span.start + time.perf_counter() - started_at
+            self.export(span)
+
+    def annotate(self, **attributes):
+        # adds to the running span, if any
+        span = current_span.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def export(self, span: Span):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(json.dumps(span.to_dict(), default=str) + "\n")
+            if not span.parent_id:
+                # a whole trace at a time
+                self.file.flush()
+
+    def close(self):
+        self.configure("")
+
+
+tracer = Tracer.shared()